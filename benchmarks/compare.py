@@ -0,0 +1,72 @@
+#!/usr/bin/python
+#
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# compare.py - compares two result files written by run.py
+
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+
+
+def timings(results):
+    """Flattens a result file's timings into a dictionary"""
+    ret = {'convert': results['convert']}
+    for name, seconds in results['filters'].items():
+        ret['filter ' + name] = seconds
+    return ret
+
+
+def main():
+    opts = argparse.ArgumentParser(
+            description="Compares two benchmark result files written by run.py")
+
+    opts.add_argument('old', help="Baseline results")
+    opts.add_argument('new', help="Results to compare against the baseline")
+
+    opts.add_argument('-t', '--threshold', default=None, type=float,
+            help="Fail if any timing is slower than the baseline by more " +
+            "than this factor, e.g. 1.1")
+
+    args = opts.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    if old['params'] != new['params']:
+        print('warning: results were generated with different parameters',
+              file=sys.stderr)
+
+    old_times = timings(old)
+    new_times = timings(new)
+    status = 0
+
+    print('%-20s %10s %10s %8s' % ('', 'old (s)', 'new (s)', 'ratio'))
+    for name in sorted(set(old_times) & set(new_times)):
+        ratio = new_times[name] / old_times[name] if old_times[name] else 0.0
+        print('%-20s %10.4f %10.4f %7.2fx' % (name, old_times[name],
+              new_times[name], ratio))
+        if args.threshold and ratio > args.threshold:
+            status = 1
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
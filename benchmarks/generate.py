@@ -0,0 +1,193 @@
+#!/usr/bin/python
+#
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# generate.py - generates synthetic mkdocs projects for benchmarking
+
+from __future__ import print_function
+
+import argparse
+import codecs
+import os
+
+# Parameters and their defaults. Every parameter is also a command line
+# option of this script and run.py.
+DEFAULTS = [
+    ('pages', 100, "Number of pages"),
+    ('depth', 3, "Nesting depth of the pages data structure"),
+    ('fanout', 4, "Number of sections per nesting level"),
+    ('paragraphs', 20, "Prose paragraphs per page"),
+    ('tables', 2, "Tables per page"),
+    ('rows', 50, "Rows per table"),
+    ('columns', 5, "Columns per table"),
+    ('images', 1, "Images per line on lines with images"),
+    ('xrefs', 1, "Cross-references per line on lines with cross-references"),
+    ('includes', 2, "Include statements per page (include fan-out)"),
+    ('snippets', 10, "Number of distinct include files"),
+    ('fence', 100, "Lines per fenced code block (one per page)"),
+]
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua').split()
+
+
+def add_arguments(opts):
+    """Adds the generator's parameters to an ArgumentParser"""
+    for name, default, helptext in DEFAULTS:
+        opts.add_argument('--' + name, default=default, type=int,
+                help="%s (default: %d)" % (helptext, default))
+
+
+def params_from_args(args):
+    """Returns the generator's parameters from parsed arguments as a
+    dictionary"""
+    return dict([(name, getattr(args, name)) for name, _, _ in DEFAULTS])
+
+
+def prose(n, words=12):
+    """Returns a line of `words` words of filler text"""
+    return ' '.join([WORDS[(n + i) % len(WORDS)] for i in range(words)])
+
+
+def nest(files, depth, fanout, level=1):
+    """Arranges page file names into a pages data structure `depth` levels
+    deep"""
+    if depth <= 1 or len(files) <= 1:
+        return [{'Page %s' % os.path.splitext(os.path.basename(f))[0]: f}
+                for f in files]
+
+    size = (len(files) + fanout - 1) // fanout
+    pages = []
+    for i in range(0, len(files), size):
+        pages.append({'Section %d.%d' % (level, i // size):
+                      nest(files[i:i + size], depth - 1, fanout, level + 1)})
+    return pages
+
+
+def dump_pages(pages, indent=0):
+    """Serializes a pages data structure as YAML"""
+    lines = []
+    for page in pages:
+        title, value = list(page.items())[0]
+        if isinstance(value, list):
+            lines.append('%s- %s:' % (' ' * indent, title))
+            lines.extend(dump_pages(value, indent + 4))
+        else:
+            lines.append('%s- %s: %s' % (' ' * indent, title, value))
+    return lines
+
+
+def page_content(n, files, p):
+    """Generates the content of page number `n`"""
+    lines = ['# Page %d' % n, '', '[TOC]', '']
+
+    for i in range(p['includes']):
+        lines.append('{!snippets/snippet%d.md!}' % ((n + i) % p['snippets']))
+    lines.append('')
+
+    for i in range(p['paragraphs']):
+        lines.append('## Section %d <a name="s%d"></a>' % (i, i))
+        lines.append('')
+        lines.append(prose(i))
+
+        if i % 2 == 0 and p['images']:
+            lines.append(' '.join(['![fig %d](img/fig%d.png)' % (j, j)
+                                   for j in range(p['images'])]))
+        if i % 2 == 1 and p['xrefs']:
+            lines.append(' '.join(['see [page %d](%s)' %
+                                   (j, files[(n + j) % len(files)])
+                                   for j in range(p['xrefs'])]))
+        lines.append(prose(i + 1))
+        lines.append('')
+
+        if i < p['tables']:
+            cols = p['columns']
+            lines.append('| ' + ' | '.join(['Column %d' % c
+                                             for c in range(cols)]) + ' |')
+            lines.append('|' + '|'.join(['---'] * cols) + '|')
+            for r in range(p['rows']):
+                lines.append('| ' + ' | '.join([prose(r + c, 1 + (r * c) % 8)
+                                                 for c in range(cols)]) + ' |')
+            lines.append('')
+
+    if p['fence']:
+        lines.append('```')
+        for i in range(p['fence']):
+            lines.append('# line %d' % i if i % 10 == 0 else
+                         'x%d = compute(%d) | filter' % (i, i))
+        lines.append('```')
+        lines.append('')
+
+    return lines
+
+
+def write_lines(path, lines):
+    with codecs.open(path, 'w', 'utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def generate(target, **kwargs):
+    """Generates a synthetic mkdocs project in directory `target`. Returns
+    the path of its mkdocs.yml."""
+    p = dict([(name, default) for name, default, _ in DEFAULTS])
+    p.update(kwargs)
+
+    docs = os.path.join(target, 'docs')
+    for d in (docs, os.path.join(docs, 'snippets')):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+
+    files = ['chapter%d/page%d.md' % (n % max(p['fanout'], 1), n)
+             for n in range(p['pages'])]
+
+    for n in range(p['pages']):
+        path = os.path.join(docs, files[n])
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        write_lines(path, page_content(n, files, p))
+
+    for n in range(p['snippets']):
+        write_lines(os.path.join(docs, 'snippets', 'snippet%d.md' % n),
+                    ['Snippet %d: %s' % (n, prose(n))])
+
+    config = os.path.join(target, 'mkdocs.yml')
+    write_lines(config, [
+        'site_name: Synthetic benchmark',
+        'markdown_extensions:',
+        '    - toc',
+        '    - tables',
+        '    - markdown_include.include',
+        'pages:',
+        ] + dump_pages(nest(files, p['depth'], max(p['fanout'], 1)), 4))
+
+    return config
+
+
+def main():
+    opts = argparse.ArgumentParser(
+            description="Generates a synthetic mkdocs project")
+
+    opts.add_argument('target',
+            help="Directory to generate the project in")
+
+    add_arguments(opts)
+
+    args = opts.parse_args()
+
+    print(generate(args.target, **params_from_args(args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/python
+#
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# run.py - times PandocConverter.convert() and every filter on a synthetic
+#          mkdocs project and writes the results as JSON
+#
+# Compare two result files with compare.py.
+
+from __future__ import print_function
+
+import argparse
+import codecs
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import timeit
+
+import generate
+
+import mkdocs_pandoc
+import mkdocs_pandoc.filters.anchors
+import mkdocs_pandoc.filters.chapterhead
+import mkdocs_pandoc.filters.exclude
+import mkdocs_pandoc.filters.headlevels
+import mkdocs_pandoc.filters.images
+import mkdocs_pandoc.filters.include
+import mkdocs_pandoc.filters.tables
+import mkdocs_pandoc.filters.toc
+import mkdocs_pandoc.filters.xref
+
+
+def best(func, repeat):
+    """Returns the best of `repeat` timings of func() in seconds"""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def bench_filters(pconv, repeat):
+    """Times every filter on its own. Per-page filters run on all pages, one
+    page at a time; document filters run on the whole document as produced
+    by the per-page filters."""
+    docs_dir = pconv.config['docs_dir']
+    pages = pconv.pages
+
+    sources = []
+    for page in pages:
+        with codecs.open(os.path.join(docs_dir, page['file']), 'r',
+                pconv.encoding) as f:
+            sources.append([line.rstrip() for line in f.read().splitlines()])
+
+    f_exclude = mkdocs_pandoc.filters.exclude.ExcludeFilter(
+            exclude=['snippets/snippet0.md'])
+    f_include = mkdocs_pandoc.filters.include.IncludeFilter(
+            base_path=docs_dir)
+    f_headlevel = mkdocs_pandoc.filters.headlevels.HeadlevelFilter(pages)
+    f_chapterheads = [mkdocs_pandoc.filters.chapterhead.ChapterheadFilter(
+                          headlevel=page['level'], title=page['title'])
+                      for page in pages]
+    f_images = [mkdocs_pandoc.filters.images.ImageFilter(
+                    filename=page['file'], image_path='site')
+                for page in pages]
+
+    def per_page(run):
+        return lambda: [run(i, lines) for i, lines in enumerate(sources)]
+
+    results = {
+        'exclude': best(per_page(lambda i, l: f_exclude.run(l)), repeat),
+        'include': best(per_page(lambda i, l: f_include.run(l)), repeat),
+        'headlevel': best(per_page(lambda i, l: f_headlevel.run(l)), repeat),
+        'chapterhead': best(per_page(lambda i, l: f_chapterheads[i].run(l)),
+                            repeat),
+        'image': best(per_page(lambda i, l: f_images[i].run(l)), repeat),
+    }
+
+    document = list(pconv.iter_pages(pages))
+
+    document_filters = {
+        'anchors': mkdocs_pandoc.filters.anchors.AnchorFilter(),
+        'xref': mkdocs_pandoc.filters.xref.XrefFilter(pages=pages),
+        'toc': mkdocs_pandoc.filters.toc.TocFilter(),
+        'tables': mkdocs_pandoc.filters.tables.TableFilter(width=pconv.width),
+    }
+
+    for name, f in document_filters.items():
+        results[name] = best(lambda: f.run(document), repeat)
+
+    return results
+
+
+def main():
+    opts = argparse.ArgumentParser(
+            description="Benchmarks mkdocs_pandoc on a synthetic project")
+
+    opts.add_argument('-r', '--repeat', default=3, type=int,
+            help="Number of repetitions, the best one is reported (default: 3)")
+
+    opts.add_argument('-j', '--jobs', default=1, type=int,
+            help="Worker processes for the end-to-end conversion (default: 1)")
+
+    opts.add_argument('-o', '--output', default=None,
+            help="File to write JSON results to (default: STDOUT)")
+
+    opts.add_argument('--project', default=None,
+            help="Directory to generate the project in; kept after the run " +
+            "(default: temporary directory)")
+
+    generate.add_arguments(opts)
+
+    args = opts.parse_args()
+    params = generate.params_from_args(args)
+
+    target = args.project or tempfile.mkdtemp(prefix='mkdocs-pandoc-bench')
+
+    try:
+        config = generate.generate(target, **params)
+        pconv = mkdocs_pandoc.PandocConverter(config_file=config,
+                base_dir=target, jobs=args.jobs)
+
+        document = pconv.convert()
+
+        results = {
+            'params': params,
+            'jobs': args.jobs,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'output_lines': len(document),
+            'convert': best(pconv.convert, args.repeat),
+            'filters': bench_filters(pconv, args.repeat),
+        }
+    finally:
+        if not args.project:
+            shutil.rmtree(target)
+
+    out = json.dumps(results, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(out + '\n')
+    else:
+        print(out)
+
+
+if __name__ == '__main__':
+    main()
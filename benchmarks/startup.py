@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# startup.py - measures the import time of mkdocs2pandoc using -X importtime
+#              (Python 3.7 or later)
+#
+# Only importing the CLI module is timed, not a conversion. A conversion run
+# from the command line still imports python-markdown, since the table filter
+# is always enabled there (filter_tables defaults to True and mkdocs2pandoc
+# has no option to turn it off).
+
+from __future__ import print_function
+
+import argparse
+import re
+import subprocess
+import sys
+
+# Modules that should only be imported when a conversion needs them
+LAZY_MODULES = ['markdown', 'markdown_include', 'multiprocessing',
+                'mkdocs_pandoc.filters.tables', 'mkdocs_pandoc.filters.include']
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_times(module):
+    """Imports `module` in a fresh interpreter. Returns a dictionary mapping
+    the names of all imported modules to their cumulative import time in
+    microseconds."""
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                             'import %s' % module],
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    _, err = proc.communicate()
+
+    times = {}
+    for line in err.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def main():
+    opts = argparse.ArgumentParser(
+            description="Measures the import time of mkdocs2pandoc")
+
+    opts.add_argument('-m', '--module', default='mkdocs_pandoc.cli.mkdocs2pandoc',
+            help="Module to import (default: mkdocs_pandoc.cli.mkdocs2pandoc)")
+
+    opts.add_argument('-r', '--repeat', default=10, type=int,
+            help="Number of repetitions, the best one is reported (default: 10)")
+
+    opts.add_argument('--max-ms', default=None, type=float,
+            help="Fail if the import takes longer than this many milliseconds")
+
+    args = opts.parse_args()
+
+    best = None
+    for i in range(args.repeat):
+        times = import_times(args.module)
+        if best is None or times[args.module] < best[args.module]:
+            best = times
+
+    status = 0
+    total = best[args.module] / 1000.0
+    print('%-40s %10.1f ms' % (args.module, total))
+
+    for module in LAZY_MODULES:
+        if module in best:
+            print('%s imported eagerly (%.1f ms)' % (module,
+                best[module] / 1000.0))
+            status = 1
+
+    if args.max_ms is not None and total > args.max_ms:
+        print('import time exceeds %.1f ms' % args.max_ms)
+        status = 1
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+#
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# tables.py - benchmarks for mkdocs_pandoc.filters.tables
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+from mkdocs_pandoc.filters.tables import TableFilter
+
+
+class UnscreenedTableFilter(TableFilter):
+    """TableFilter without the pre-screen, i.e. every block goes through
+    TableProcessor.test()"""
+
+    def is_candidate(self, block):
+        return True
+
+
+def sparse_corpus(blocks=20000, table_every=100):
+    """Generates prose paragraphs with a small table every `table_every`
+    blocks"""
+    lines = []
+    for i in range(blocks):
+        if i % table_every == 0:
+            lines.extend(['| Key | Value |', '|-----|-------|',
+                          '| a | 1 |', '| b | 2 |'])
+        else:
+            lines.extend(['Paragraph %d has some prose in it, but no pipes.' % i,
+                          'It spans a second line | and a pipe in the middle.'])
+        lines.append('')
+    return lines
+
+
+def large_table(rows=5000, columns=12):
+    """Generates a single table with repetitive cell values, like a data
+    dictionary"""
+    values = ['Yes', 'No', 'N/A', 'VARCHAR(255)', 'See [docs](http://x.org/y)',
+              'A longer description of this field that will need wrapping']
+    lines = ['| ' + ' | '.join(['Column %d' % c for c in range(columns)]) + ' |',
+             '|' + '|'.join(['---'] * columns) + '|']
+    for r in range(rows):
+        lines.append('| ' + ' | '.join(
+            [values[(r + c) % len(values)] for c in range(columns)]) + ' |')
+    lines.append('')
+    return lines
+
+
+def bench(name, func, repeat):
+    best = min(timeit.repeat(func, number=1, repeat=repeat))
+    print('%-40s %10.4f s' % (name, best))
+    return best
+
+
+def main():
+    opts = argparse.ArgumentParser(
+            description="Benchmarks for the table filter")
+
+    opts.add_argument('-b', '--blocks', default=20000, type=int,
+            help="Number of blocks in the table-sparse corpus (default: 20000)")
+
+    opts.add_argument('-R', '--rows', default=5000, type=int,
+            help="Number of rows in the large table (default: 5000)")
+
+    opts.add_argument('-r', '--repeat', default=5, type=int,
+            help="Number of repetitions, the best one is reported (default: 5)")
+
+    args = opts.parse_args()
+
+    lines = sparse_corpus(args.blocks)
+
+    unscreened = bench('sparse corpus, no pre-screen',
+            lambda: UnscreenedTableFilter().run(lines), args.repeat)
+    screened = bench('sparse corpus, pre-screen',
+            lambda: TableFilter().run(lines), args.repeat)
+    print('speedup: %.2fx' % (unscreened / screened))
+
+    table = large_table(args.rows)
+
+    bench('large table, %d rows' % args.rows,
+            lambda: TableFilter().run(table), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
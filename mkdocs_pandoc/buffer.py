@@ -0,0 +1,101 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""In-place page buffer for per-page filters"""
+
+import itertools
+
+from mkdocs_pandoc.lineindex import LineIndex
+
+
+def matching(search, lines):
+    """Returns an iterator over the indices of all lines for which search()
+    returns a true value. The lines are scanned without a Python level loop,
+    which matters since most lines match none of the filters."""
+    return itertools.compress(itertools.count(), map(search, lines))
+
+
+class PageBuffer(object):
+    """The lines of a page while per-page filters process it. Filters change
+    lines in place through rewrite() and expand() and add lines in front of
+    the page through prepend(), so lines no filter touches are never copied.
+    tolist() returns the result.
+
+    classify() returns a LineIndex of the page (not including prepended
+    lines), which filters use to find the lines they need to look at. It is
+    built when first needed and rebuilt after lines were changed, unless
+    they were changed through rewrite_indexed()."""
+
+    __slots__ = ('head', 'lines', 'index')
+
+    def __init__(self, lines):
+        self.head = []
+        self.lines = lines
+        self.index = None
+
+    def __len__(self):
+        return len(self.head) + len(self.lines)
+
+    def __iter__(self):
+        return itertools.chain(self.head, self.lines)
+
+    def prepend(self, lines):
+        """Adds lines in front of the page"""
+        self.head[0:0] = lines
+
+    def classify(self):
+        """Returns the LineIndex of the page's lines"""
+        if self.index is None:
+            self.index = LineIndex(self.lines)
+
+        return self.index
+
+    def rewrite(self, search, rewrite):
+        """Replaces every line for which search(line) returns a true value by
+        rewrite(line)"""
+        for lines in (self.head, self.lines):
+            for i in matching(search, lines):
+                lines[i] = rewrite(lines[i])
+                self.index = None
+
+    def rewrite_indexed(self, search, indices, rewrite):
+        """Like rewrite(), but only the page's lines at `indices` (taken from
+        the LineIndex) are considered; prepended lines are searched as usual.
+        The caller is responsible for the index still being accurate."""
+        head = self.head
+        for i in matching(search, head):
+            head[i] = rewrite(head[i])
+
+        lines = self.lines
+        for i in indices:
+            lines[i] = rewrite(lines[i])
+
+    def expand(self, search, expand):
+        """Replaces every line for which search(line) returns a true value by
+        the list of lines expand(line) returns"""
+        for lines in (self.head, self.lines):
+            # Lines are replaced back to front, so the indices of the ones
+            # still to be replaced remain valid.
+            for i in reversed(list(matching(search, lines))):
+                lines[i:i + 1] = expand(lines[i])
+                self.index = None
+
+    def tolist(self):
+        """Returns the page as a list of lines. The buffer must not be used
+        afterwards."""
+        if self.head:
+            self.lines[0:0] = self.head
+            self.head = []
+
+        return self.lines
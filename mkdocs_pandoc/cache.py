@@ -0,0 +1,143 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from mkdocs_pandoc.exceptions import FatalError
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Bump this whenever a change to the filters alters their output, so stale
+# cache entries are not reused.
+CACHE_VERSION = '3'
+
+
+class PageCache(object):
+    """On-disk cache of per-page filter output. Entries are stored as one file
+    per key and evicted least recently used first once the cache grows beyond
+    `max_size` bytes."""
+
+    def __init__(self, cache_dir, max_size=100 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+        except OSError as e:
+            raise FatalError("Couldn't create cache directory %s: %s" %
+                    (self.cache_dir, e.strerror), 1)
+
+    def key(self, parts):
+        """Computes a cache key from a list of strings"""
+        h = hashlib.sha1(CACHE_VERSION.encode('utf-8'))
+        for part in parts:
+            h.update(b'\0')
+            h.update(part.encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        """Returns the cached list of lines for `key`, or None on a miss"""
+        data = self._read(key)
+        if data is None:
+            return None
+
+        return data.decode('utf-8').split('\n')
+
+    def put(self, key, lines):
+        """Stores a list of lines under `key`"""
+        self._write(key, '\n'.join(lines).encode('utf-8'))
+
+    def get_object(self, key):
+        """Returns the object pickled under `key`, or None on a miss"""
+        data = self._read(key)
+        if data is None:
+            return None
+
+        try:
+            return pickle.loads(data)
+        except Exception:
+            # Entries written by an incompatible Python version or damaged
+            # ones are misses.
+            return None
+
+    def put_object(self, key, obj):
+        """Pickles an object and stores it under `key`"""
+        self._write(key, pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+    def _read(self, key):
+        path = os.path.join(self.cache_dir, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except IOError:
+            return None
+
+        # Record use for LRU eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return data
+
+    def _write(self, key, data):
+        # The entry is written to a temporary file first, so concurrent
+        # readers never see partial entries.
+        path = os.path.join(self.cache_dir, key)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp')
+        except OSError:
+            # A cache that cannot be written to is not fatal.
+            return
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def prune(self):
+        """Evicts least recently used entries until the cache fits into
+        `max_size` bytes"""
+        entries = []
+        total = 0
+
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('.tmp'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+
+        entries.sort()
+
+        for mtime, size, name in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total -= size
+
@@ -20,9 +20,11 @@ from __future__ import print_function
 
 import argparse
 import codecs
+import errno
+import os
 import sys
+import time
 
-import mkdocs.config
 from mkdocs_pandoc.exceptions import FatalError
 
 import mkdocs_pandoc
@@ -32,6 +34,17 @@ def main():
             description="mdtableconv.py " +
             "- converts pipe delimited tables to Pandoc's grid tables")
 
+    opts.add_argument('--batch', default=None,
+            help="Convert all projects listed in this file, one " +
+            "\"mkdocs.yml output-file\" pair per line, and report timings")
+
+    opts.add_argument('--cache-dir', default=None,
+            help="Directory for caching per-page output between runs " +
+            "(default: no caching)")
+
+    opts.add_argument('--cache-size', default=100, type=int,
+            help="Maximum size of the page cache in MB (default: 100)")
+
     opts.add_argument('-e', '--encoding', default='utf-8',
             help="Set encoding for input files (default: utf-8)")
 
@@ -41,42 +54,263 @@ def main():
     opts.add_argument('-i', '--image-ext', default=None,
             help="Extension to substitute image extensions by (default: no replacement)")
 
-    opts.add_argument('-w', '--width', default=100,
+    opts.add_argument('-w', '--width', default=100, type=int,
             help="Width of generated grid tables in characters (default: 100)")
 
     opts.add_argument('-x', '--exclude', default=None, action='append',
             help="Include files to skip (default: none)")
 
+    opts.add_argument('-j', '--jobs', default=1, type=int,
+            help="Number of worker processes for per-page processing; 0 " +
+            "uses one per CPU (default: 1)")
+
     opts.add_argument('-o', '--outfile', default=None,
             help="File to write finished pandoc document to (default: STDOUT)")
 
-    args = opts.parse_args()
+    opts.add_argument('--pandoc-args', default=None,
+            help="Run pandoc with these arguments and stream the document " +
+            "into it instead of writing it out, e.g. " +
+            "'-f markdown+grid_tables --toc -o book.pdf'")
 
-    # Python 2 and Python 3 have mutually incompatible approaches to writing
-    # encoded data to sys.stdout, so we'll have to pick the appropriate one.
+    opts.add_argument('--pandoc', default='pandoc',
+            help="pandoc executable to run for --pandoc-args " +
+            "(default: pandoc)")
 
-    if sys.version_info.major == 2:
-      out = codecs.getwriter(args.encoding)(sys.stdout)
-    elif sys.version_info.major >= 3:
-      out = open(sys.stdout.fileno(), mode='w', encoding=args.encoding, buffering=1)
+    opts.add_argument('--split-dir', default=None, metavar='DIR',
+            help="Write one pandoc document per top level chapter and a " +
+            "manifest (manifest.json) to this directory")
 
-    try:
-      pconv = mkdocs_pandoc.PandocConverter(
+    opts.add_argument('--stats', default=None,
+            help="Write per-page and per-filter timings, line counts and " +
+            "allocations to this file as JSON and report the slowest pages " +
+            "on STDERR")
+
+    opts.add_argument('--stats-top', default=10, type=int,
+            help="Number of slowest pages to report with --stats (default: 10)")
+
+    opts.add_argument('--stats-alloc', default=False, action='store_true',
+            help="Trace allocations for --stats (slow, Python 3 only)")
+
+    opts.add_argument('--watch', default=False, action='store_true',
+            help="Keep running and rewrite the output file whenever the " +
+            "documentation changes (requires --outfile)")
+
+    opts.add_argument('--watch-interval', default=1.0, type=float,
+            help="Seconds between checks for changes in watch mode " +
+            "(default: 1)")
+
+    opts.add_argument('--serve', default=None, metavar='SOCKET',
+            help="Run as a daemon serving conversions on this Unix domain " +
+            "socket")
+
+    opts.add_argument('--idle-timeout', default=600, type=int,
+            help="Seconds after which --serve forgets unused projects " +
+            "(default: 600)")
+
+    opts.add_argument('--client', default=None, metavar='SOCKET',
+            help="Have the daemon listening on this socket do the conversion")
+
+    args = opts.parse_args()
+
+    converter_args = dict(
+                cache_dir=args.cache_dir,
+                cache_size=args.cache_size * 1024 * 1024,
                 config_file=args.config_file,
                 exclude=args.exclude,
                 image_ext=args.image_ext,
+                jobs=args.jobs,
                 width=args.width,
                 encoding=args.encoding,
                 )
+
+    if args.stats and (args.batch or args.watch):
+        print("--stats can't be combined with --batch or --watch",
+                file=sys.stderr)
+        return(1)
+
+    if args.pandoc_args is not None and (args.outfile or args.batch or
+            args.watch):
+        print("--pandoc-args can't be combined with --outfile, --batch or " +
+                "--watch", file=sys.stderr)
+        return(1)
+
+    if (args.serve or args.client) and (args.batch or args.watch or
+            args.stats):
+        print("--serve and --client can't be combined with --batch, " +
+                "--watch or --stats", file=sys.stderr)
+        return(1)
+
+    if args.split_dir and (args.outfile or args.pandoc_args is not None or
+            args.batch or args.watch or args.serve or args.client):
+        print("--split-dir can't be combined with --outfile, --pandoc-args, " +
+                "--batch, --watch, --serve or --client", file=sys.stderr)
+        return(1)
+
+    if args.serve:
+        from mkdocs_pandoc.server import Server
+        try:
+            Server(args.serve, idle_timeout=args.idle_timeout,
+                    jobs=args.jobs).serve_forever()
+        except FatalError as e:
+            print(e.message, file=sys.stderr)
+            return(e.status)
+        except KeyboardInterrupt:
+            return(0)
+
+    if args.batch:
+        return(batch(args.batch, converter_args))
+
+    if args.watch:
+        if not args.outfile:
+            print("--watch requires --outfile", file=sys.stderr)
+            return(1)
+        from mkdocs_pandoc.watch import Watcher
+        try:
+            Watcher(args.outfile,
+                    interval=args.watch_interval, **converter_args).run()
+        except FatalError as e:
+            print(e.message, file=sys.stderr)
+            return(e.status)
+        except KeyboardInterrupt:
+            return(0)
+
+    if args.stats:
+        from mkdocs_pandoc.stats import Stats
+        converter_args['stats'] = Stats(trace_memory=args.stats_alloc)
+
+    if args.split_dir:
+        from mkdocs_pandoc.split import write_chapters
+        try:
+            pconv = mkdocs_pandoc.PandocConverter(**converter_args)
+            write_chapters(pconv, args.split_dir)
+        except FatalError as e:
+            print(e.message, file=sys.stderr)
+            return(e.status)
+
+        if args.stats:
+            return(write_stats(args.stats, converter_args['stats'],
+                               args.stats_top))
+        return(0)
+
+    # Lines are encoded and written in large chunks as they are produced, so
+    # output starts before the last page has been read. Output files are
+    # replaced atomically.
+    from mkdocs_pandoc.output import chunks, write_chunks, \
+            write_chunks_atomic, write_chunks_pipe
+
+    if args.client:
+        from mkdocs_pandoc.server import Client
+        # The daemon decides on the number of worker processes
+        del converter_args['jobs']
+        document = Client(args.client).convert(converter_args)
+    else:
+        try:
+          pconv = mkdocs_pandoc.PandocConverter(**converter_args)
+        except FatalError as e:
+            print(e.message, file=sys.stderr)
+            return(e.status)
+        document = chunks(pconv.convert_iter(), args.encoding)
+
+    try:
+        if args.pandoc_args is not None:
+            import shlex
+            status = write_chunks_pipe(
+                    [args.pandoc] + shlex.split(args.pandoc_args), document)
+            if status:
+                print("%s exited with status %d" % (args.pandoc, status),
+                        file=sys.stderr)
+                return(status)
+        elif args.outfile:
+            write_chunks_atomic(args.outfile, document)
+        else:
+            # Python 3 only accepts encoded data on sys.stdout.buffer
+            write_chunks(getattr(sys.stdout, 'buffer', sys.stdout), document)
     except FatalError as e:
         print(e.message, file=sys.stderr)
         return(e.status)
-    if args.outfile:
-        try:
-          out = codecs.open(args.outfile, 'w', encoding=args.encoding)
-        except IOError as e:
-          print("Couldn't open %s for writing: %s" % (args.outfile, e.strerror), file=sys.stderr)
+    except (IOError, OSError) as e:
+        # The reader of a pipe exited before reading everything. Standard
+        # output is pointed at /dev/null to keep the interpreter from failing
+        # again when it flushes it on exit.
+        if e.errno == errno.EPIPE:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            return(1)
+        print("Couldn't write %s: %s" % (args.outfile or 'output',
+                e.strerror), file=sys.stderr)
+        return(1)
+
+    if args.stats:
+        return(write_stats(args.stats, converter_args['stats'],
+                           args.stats_top))
+
+
+def write_stats(filename, stats, top):
+    """Writes statistics to `filename` as JSON and prints a report of the
+    `top` slowest pages to standard error"""
+    import json
+
+    try:
+        f = open(filename, 'w')
+    except IOError as e:
+        print("Couldn't open %s for writing: %s" % (filename, e.strerror),
+                file=sys.stderr)
+        return(1)
+
+    json.dump(stats.as_dict(), f, indent=2, sort_keys=True)
+    f.write('\n')
+    f.close()
+
+    for line in stats.report(top):
+        print(line, file=sys.stderr)
+
+    return(0)
+
+
+def batch(batchfile, converter_args):
+    """Converts all projects listed in `batchfile`. Paths are relative to the
+    batch file's location. Prints per-project timings to standard error."""
+    projects = []
+    base = os.path.dirname(batchfile)
+
+    try:
+        f = codecs.open(batchfile, 'r', converter_args['encoding'])
+    except IOError as e:
+        print("Couldn't open %s for reading: %s" % (batchfile, e.strerror),
+                file=sys.stderr)
+        return(1)
+
+    for line in f.readlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = line.split()
+        if len(fields) != 2:
+            print("Invalid line in %s: %s" % (batchfile, line),
+                    file=sys.stderr)
+            return(1)
+        projects.append((os.path.join(base, fields[0]),
+                         os.path.join(base, fields[1])))
+
+    f.close()
+
+    converter_args.pop('config_file')
+    jobs = converter_args.pop('jobs')
+    start = time.time()
+    status = 0
+
+    for config_file, outfile, seconds, error in \
+            mkdocs_pandoc.PandocConverter.convert_many(projects, jobs,
+                    **converter_args):
+        if error:
+            print("%8.2f s  %s: %s" % (seconds, config_file, error),
+                    file=sys.stderr)
+            status = 1
+        else:
+            print("%8.2f s  %s -> %s" % (seconds, config_file, outfile),
+                    file=sys.stderr)
+
+    print("%8.2f s  total (%d projects)" % (time.time() - start,
+            len(projects)), file=sys.stderr)
 
-    for line in pconv.convert():
-        out.write(line + '\n')
-    out.close()
+    return(status)
@@ -0,0 +1,118 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Parsing and caching of mkdocs configuration files"""
+
+import collections
+import hashlib
+import threading
+
+from mkdocs_pandoc.exceptions import FatalError
+
+# Bump this whenever the parsed configuration or the flattened pages change
+# form, so stale cache entries are not reused.
+CONFIG_CACHE_VERSION = '3'
+
+# The YAML loader is created on first use: configurations found in the cache
+# are used without importing yaml at all.
+_loader = None
+
+
+def _construct_unknown(loader, suffix, node):
+    """Loads values with tags the safe loader does not know, such as the
+    !!python/name tags some markdown extensions' options use, as plain
+    data"""
+    import yaml
+
+    if isinstance(node, yaml.MappingNode):
+        return loader.construct_mapping(node, deep=True)
+    if isinstance(node, yaml.SequenceNode):
+        return loader.construct_sequence(node, deep=True)
+    return loader.construct_scalar(node)
+
+
+def loader():
+    """Returns the YAML loader class for configuration files: the safe loader,
+    accelerated by libyaml if available, tolerating unknown tags."""
+    global _loader
+
+    if _loader is None:
+        import yaml
+
+        class ConfigLoader(getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):
+            pass
+
+        ConfigLoader.add_multi_constructor('', _construct_unknown)
+        _loader = ConfigLoader
+
+    return _loader
+
+
+def parse(text, filename):
+    """Parses a configuration file's content. Returns a dictionary."""
+    import yaml
+
+    try:
+        config = yaml.load(text, Loader=loader())
+    except yaml.YAMLError as e:
+        raise FatalError("Couldn't parse %s: %s" % (filename, e), 1)
+
+    if config is None:
+        return {}
+
+    if not isinstance(config, dict):
+        raise FatalError("%s is not a mkdocs configuration file" % filename, 1)
+
+    return config
+
+
+def config_key(data, encoding):
+    """Computes the cache key for a configuration file's raw content"""
+    h = hashlib.sha1(CONFIG_CACHE_VERSION.encode('utf-8'))
+    h.update(b'\0')
+    h.update(encoding.encode('utf-8'))
+    h.update(b'\0')
+    h.update(data)
+    return 'config-' + h.hexdigest()
+
+
+class ConfigCache(object):
+    """In-memory cache of parsed configurations and their flattened pages,
+    keyed by config_key(). Holds up to `max_entries` entries, evicting the
+    least recently used one first."""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached entry for `key`, or None on a miss"""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+            return entry
+
+    def put(self, key, entry):
+        """Stores an entry under `key`"""
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# Shared by all converters in a process
+default_cache = ConfigCache()
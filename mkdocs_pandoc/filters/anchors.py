@@ -18,10 +18,17 @@ import re
 class AnchorFilter(object):
     """Strips out HTML anchor tags"""
 
+    pattern = re.compile(r'<a.*?</a>')
+
     def run(self, lines):
         """Filter method"""
-        ret = []
+        return list(self.run_iter(lines))
+
+    def run_iter(self, lines):
+        """Streaming filter method: takes and yields an iterator of lines"""
         for line in lines:
-            ret.append(re.sub(r'<a.*?</a>', '', line))
+            yield self.rewrite(line)
 
-        return ret
+    def rewrite(self, line):
+        """Rewrites a single line"""
+        return self.pattern.sub('', line)
@@ -25,9 +25,17 @@ class ChapterheadFilter(object):
 
     def run(self, lines):
         """Filter method"""
+        return list(self.run_iter(lines))
 
-        head = [('#' * self.headlevel) + ' ' + self.title, '']
+    def run_iter(self, lines):
+        """Streaming filter method: takes and yields an iterator of lines"""
+        yield ('#' * self.headlevel) + ' ' + self.title
+        yield ''
 
-        head.extend(lines)
+        for line in lines:
+            yield line
 
-        return head
+    def run_buffer(self, buf):
+        """In-place filter method: changes a PageBuffer and returns it"""
+        buf.prepend([('#' * self.headlevel) + ' ' + self.title, ''])
+        return buf
@@ -20,14 +20,35 @@ class ExcludeFilter(object):
     a macros include pulled in by every chapter)"""
 
     def __init__(self, **kwargs):
-        self.exclude = kwargs.get('exclude', [])
+        self.exclude = kwargs.get('exclude', None) or []
+
+        # Compile patterns once. `pattern` matches if any of them does, which
+        # lets RewriteFilter skip lines without a candidate include statement.
+        self.patterns = [re.compile(r'\{!%s!\}' % exclude)
+                         for exclude in self.exclude]
+        self.pattern = None
+        if self.patterns:
+            self.pattern = re.compile('|'.join(
+                ['(?:%s)' % p.pattern for p in self.patterns]))
 
     def run(self, lines):
         """Filter method"""
-        ret = []
+        return list(self.run_iter(lines))
+
+    def run_iter(self, lines):
+        """Streaming filter method: takes and yields an iterator of lines"""
         for line in lines:
-            for exclude in self.exclude:
-                line = re.sub(r'\{!%s!\}' % exclude, '', line)
-            ret.append(line)
+            yield self.rewrite(line)
+
+    def run_buffer(self, buf):
+        """In-place filter method: changes a PageBuffer and returns it"""
+        if self.pattern is not None:
+            buf.rewrite(self.pattern.search, self.rewrite)
+        return buf
+
+    def rewrite(self, line):
+        """Rewrites a single line"""
+        for pattern in self.patterns:
+            line = pattern.sub('', line)
 
-        return ret
+        return line
@@ -15,26 +15,56 @@
 
 import re
 
+from mkdocs_pandoc.lineindex import FenceTracker
+
 # TODO: Implement handling for Setext style headers.
 
 class HeadlevelFilter(object):
-    """Filter for increasing Markdown header levels (only Atx style)"""
+    """Filter for increasing Markdown header levels (only Atx style). Lines
+    in fenced code blocks are left alone. Telling them apart takes more than
+    a single line, so unlike the line rewriting filters this one has no
+    `pattern` and cannot be combined into a RewriteFilter."""
 
     def __init__(self, pages):
-        max_offset = 0
+        # Determine maximum header level from nesting in mkdocs.yml. It is
+        # recorded by the flattener; plain lists of pages are scanned.
+        max_offset = getattr(pages, 'max_level', None)
 
-        # Determine maximum header level from nesting in  mkdocs.yml
-        for page in pages:
-            if page['level'] > max_offset:
-                max_offset = page['level']
+        if max_offset is None:
+            max_offset = 0
+            for page in pages:
+                if page['level'] > max_offset:
+                    max_offset = page['level']
 
         self.offset = max_offset
-
+        self.header_pattern = re.compile(r'^#')
+        self.prefix = '#' + ('#' * self.offset)
 
     def run(self, lines):
         """Filter method"""
-        ret = []
+        return list(self.run_iter(lines))
+
+    def run_iter(self, lines):
+        """Streaming filter method: takes and yields an iterator of lines"""
+        fence = FenceTracker()
+
         for line in lines:
-            ret.append(re.sub(r'^#', '#' + ('#' * self.offset), line))
+            if not fence.update(line):
+                line = self.rewrite_header(line)
+            yield line
+
+    def run_buffer(self, buf):
+        """In-place filter method: changes a PageBuffer and returns it. Only
+        the headers in the buffer's LineIndex are rewritten."""
+        if not self.offset:
+            return buf
+
+        index = buf.classify()
+        buf.rewrite_indexed(self.header_pattern.search, index.headers,
+                            self.rewrite_header)
+
+        return buf
 
-        return ret
+    def rewrite_header(self, line):
+        """Rewrites a single header line"""
+        return self.header_pattern.sub(self.prefix, line)
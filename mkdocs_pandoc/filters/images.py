@@ -18,14 +18,47 @@ import os
 import re
 
 
+# Absolute directories image names are made relative to, shared by all
+# ImageFilter instances, so pages in the same directory compute them only once.
+_image_bases = {}
+
+
 class ImageFilter(object):
     """Filter for adjusting image targets (absolute file names, optionally
     different extensions"""
+
+    pattern = re.compile(r'!\[(.*?)\]\((.*?)\)')
+    url_pattern = re.compile(r'\w+://')
+    ext_pattern = re.compile(r'\.\w+$')
+
     def __init__(self, **kwargs):
         self.filename = kwargs.get('filename', None)
         self.image_path = kwargs.get('image_path', None)
         self.adjust_path = kwargs.get('adjust_path', True)
         self.image_ext = kwargs.get('image_ext', None)
+        self.image_base = self.get_image_base()
+
+    def get_image_base(self):
+        """Returns the absolute directory image names are relative to, or
+        None if image paths are not adjusted"""
+        # Without a file name there is nothing to make image names relative to
+        if not (self.adjust_path and self.filename):
+            return None
+
+        dirname = os.path.dirname(self.filename)
+        key = (os.getcwd(), self.image_path, dirname)
+
+        if key not in _image_bases:
+            # explicitely specified image path takes precedence over
+            # path relative to chapter
+            if self.image_path:
+                base = os.path.join(os.path.abspath(self.image_path), dirname)
+            # generate image path relative to file name
+            else:
+                base = os.path.abspath(dirname)
+            _image_bases[key] = base
+
+        return _image_bases[key]
 
     def run(self, lines):
         """Filter method"""
@@ -33,57 +66,46 @@ class ImageFilter(object):
         if (not self.adjust_path) and (not self.image_ext):
             return lines
 
-        ret = []
+        return list(self.run_iter(lines))
+
+    def run_iter(self, lines):
+        """Streaming filter method: takes and yields an iterator of lines"""
+        # Nothing to do in this case
+        if (not self.adjust_path) and (not self.image_ext):
+            for line in lines:
+                yield line
+            return
 
         for line in lines:
-            processed = {}
-            while True:
-                alt = ''
-                img_name = ''
-
-                match = re.search(r'!\[(.*?)\]\((.*?)\)', line)
-
-                # Make sure there is in fact an image file name
-                if match:
-                    # Skip images we already processed
-                    if match.group(0) in processed:
-                        break
-                    # Skip URLs
-                    if re.match('\w+://', match.group(2)):
-                        break
-                    alt = match.group(1)
-                    img_name = match.group(2)
-                else:
-                    break
-
-                if self.image_ext:
-                    img_name = re.sub(r'\.\w+$', '.' + self.image_ext, img_name)
-
-                if self.adjust_path and (self.image_path or self.filename):
-                    # explicitely specified image path takes precedence over
-                    # path relative to chapter
-                    if self.image_path and self.filename:
-                        img_name = os.path.join(
-                                os.path.abspath(self.image_path),
-                                os.path.dirname(self.filename),
-                                img_name)
-
-                    # generate image path relative to file name
-                    if self.filename and (not self.image_path):
-                        img_name = os.path.join(
-                                os.path.abspath(
-                                    os.path.dirname(self.filename)),
-                                img_name)
-                    
-                # handle Windows '\', although this adds a small amount of unnecessary work on Unix systems
-                img_name = img_name.replace(os.path.sep, '/')
-                             
-                line = re.sub(r'!\[(.*?)\]\((.*?)\)',
-                        '![%s](%s)' % (alt, img_name), line)
-
-                # Mark this image as processed
-                processed[match.group(0)] = True
-
-            ret.append(line)
-
-        return ret
+            yield self.rewrite(line)
+
+    def run_buffer(self, buf):
+        """In-place filter method: changes a PageBuffer and returns it"""
+        if self.adjust_path or self.image_ext:
+            buf.rewrite_indexed(self.pattern.search, buf.classify().images,
+                                self.rewrite)
+        return buf
+
+    def rewrite(self, line):
+        """Rewrites all images on a single line"""
+        return self.pattern.sub(self.rewrite_image, line)
+
+    def rewrite_image(self, match):
+        """Replacement callback for a single image"""
+        alt = match.group(1)
+        img_name = match.group(2)
+
+        # Skip URLs
+        if self.url_pattern.match(img_name):
+            return match.group(0)
+
+        if self.image_ext:
+            img_name = self.ext_pattern.sub('.' + self.image_ext, img_name)
+
+        if self.image_base is not None:
+            img_name = os.path.join(self.image_base, img_name)
+
+        # handle Windows '\', although this adds a small amount of unnecessary work on Unix systems
+        img_name = img_name.replace(os.path.sep, '/')
+
+        return '![%s](%s)' % (alt, img_name)
@@ -16,11 +16,232 @@
 pulls in includes without running the HTML generator)"""
 
 from __future__ import print_function
+import codecs
+import collections
+import os
+import sys
+import threading
 import markdown_include.include as incl
 
 
-### This class is merely a wrapper for providing markdown_include.include
+class IncludeCache(object):
+    """Bounded in-memory cache of included files, keyed by path, modification
+    time and encoding. Least recently used files are evicted once more than
+    `max_entries` files are cached. Safe for use from multiple threads."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled (and cached content is not worth shipping
+        # to worker processes).
+        return {'max_entries': self.max_entries}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_entries'])
+
+    def get(self, filename, encoding):
+        """Returns an included file's lines the way markdown_include reads
+        them (with the last character of every line cut off). The list is
+        shared and must not be modified. Raises IOError or OSError if the
+        file cannot be read."""
+        key = (filename, os.stat(filename).st_mtime, encoding)
+
+        with self.lock:
+            text = self.entries.pop(key, None)
+            if text is not None:
+                self.entries[key] = text
+                return text
+
+        with codecs.open(filename, 'r', encoding) as r:
+            text = r.readlines()
+
+        if len(text) == 0: text.append('')
+        text = [line[0:-1] for line in text]
+
+        with self.lock:
+            self.entries[key] = text
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return text
+
+# Shared by all IncludeFilter instances unless they are given their own cache,
+# so repeated conversions in one process read every included file only once.
+default_cache = IncludeCache()
+
+
+class IncludeGraph(object):
+    """Dependency graph of include statements. Nodes are file names, edges
+    point from a file to the files it includes directly."""
+
+    def __init__(self):
+        self.edges = {}
+
+    def add(self, name, includes):
+        """Records the files directly included by `name`"""
+        self.edges[name] = list(includes)
+
+    def dependencies(self, name):
+        """Returns the sorted file names of all files included by `name`,
+        directly or through nested includes"""
+        seen = set()
+        todo = list(self.edges.get(name, []))
+
+        while todo:
+            filename = todo.pop()
+            if filename in seen:
+                continue
+            seen.add(filename)
+            todo.extend(self.edges.get(filename, []))
+
+        return sorted(seen)
+
+    def dependents(self, filename):
+        """Returns the set of files that include `filename`, directly or
+        through nested includes"""
+        reverse = {}
+        for name, includes in self.edges.items():
+            for include in includes:
+                reverse.setdefault(include, []).append(name)
+
+        seen = set()
+        todo = list(reverse.get(filename, []))
+
+        while todo:
+            name = todo.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            todo.extend(reverse.get(name, []))
+
+        return seen
+
+
+### This class provides markdown_include.include's include statements with
+### included files cached across pages.
 class IncludeFilter(incl.IncludePreprocessor):
     def __init__(self, **kwargs):
         self.base_path = kwargs.get('base_path', '.')
         self.encoding = kwargs.get('encoding', 'utf-8')
+        self.cache = kwargs.get('cache', None) or default_cache
+
+        # filename -> (lines, files they include) for dependencies()
+        self.scanned = {}
+
+    def run(self, lines):
+        """Filter method: Resolves include statements, including nested
+        ones, with the same result as markdown_include. Included files are
+        read through the cache."""
+        ret = []
+        todo = list(reversed(lines))
+
+        while todo:
+            line = todo.pop()
+            m = incl.INC_SYNTAX.search(line)
+
+            if not m:
+                ret.append(line)
+                continue
+
+            filename = self.resolve(m.group(1))
+            try:
+                text = self.cache.get(filename, self.encoding)
+            except Exception as e:
+                print('Warning: could not find file {}. Ignoring '
+                    'include statement. Error: {}'.format(filename, e),
+                    file=sys.stderr)
+                ret.append(incl.INC_SYNTAX.sub('', line))
+                continue
+
+            # Included lines are scanned for further include statements.
+            line_split = incl.INC_SYNTAX.split(line, maxsplit=0)
+            text = list(text)
+            text[0] = line_split[0] + text[0]
+            text[-1] = text[-1] + line_split[2]
+            todo.extend(reversed(text))
+
+        return ret
+
+    def run_iter(self, lines):
+        """Streaming filter method: takes and yields an iterator of lines.
+
+        Includes may be nested, so this needs the whole page in memory."""
+        for line in self.run(list(lines)):
+            yield line
+
+    def run_buffer(self, buf):
+        """In-place filter method: changes a PageBuffer and returns it. Only
+        lines with include statements are replaced."""
+        buf.expand(incl.INC_SYNTAX.search, lambda line: self.run([line]))
+        return buf
+
+    def resolve(self, filename):
+        """Resolves an include statement's file name the way
+        markdown_include does"""
+        filename = os.path.expanduser(filename)
+        if not os.path.isabs(filename):
+            filename = os.path.normpath(os.path.join(self.base_path, filename))
+        return filename
+
+    def includes(self, lines):
+        """Returns the resolved file names of the files directly included by
+        lines. Like markdown_include, only the first include statement on a
+        line is honored."""
+        ret = []
+        for line in lines:
+            match = incl.INC_SYNTAX.search(line)
+            if match:
+                ret.append(self.resolve(match.group(1)))
+
+        return ret
+
+    def add_to_graph(self, graph, name, lines):
+        """Adds `name` and all files it includes, directly or through nested
+        includes, to an IncludeGraph"""
+        graph.add(name, self.includes(lines))
+        todo = list(graph.edges[name])
+
+        while todo:
+            filename = todo.pop()
+            if filename in graph.edges:
+                continue
+            try:
+                text = self.cache.get(filename, self.encoding)
+            except (IOError, OSError):
+                # markdown_include merely warns about missing files
+                text = []
+            graph.add(filename, self.includes(text))
+            todo.extend(graph.edges[filename])
+
+    def dependencies(self, lines):
+        """Returns the files included by lines, directly or through nested
+        includes, as a sorted list of (file name, lines) tuples, where lines
+        are the file's lines as returned by the cache, or None if the file
+        cannot be read. Included files are only scanned for include
+        statements again once the cache returns new lines for them."""
+        found = {}
+        todo = self.includes(lines)
+
+        while todo:
+            filename = todo.pop()
+            if filename in found:
+                continue
+
+            try:
+                text = self.cache.get(filename, self.encoding)
+            except (IOError, OSError):
+                # markdown_include merely warns about missing files
+                found[filename] = None
+                continue
+
+            found[filename] = text
+
+            scanned = self.scanned.get(filename)
+            if scanned is None or scanned[0] is not text:
+                scanned = self.scanned[filename] = (text, self.includes(text))
+            todo.extend(scanned[1])
+
+        return sorted(found.items(), key=lambda item: item[0])
@@ -0,0 +1,65 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import re
+
+class RewriteFilter(object):
+    """Combines several line rewriting filters into a single pass.
+
+    Every filter passed in must provide a compiled regular expression
+    `pattern` that matches wherever it would change a line (or None if it
+    has nothing to do) and a `rewrite(line)` method. The patterns are merged
+    into one alternation that is searched once per line; only lines with a
+    match are handed to the filters' rewrite() methods, in the original
+    order. Since a filter never changes a line its pattern does not match,
+    the output is identical to running the filters one after another."""
+
+    def __init__(self, filters):
+        self.filters = [f for f in filters if f.pattern is not None]
+        self.pattern = None
+
+        if self.filters:
+            self.pattern = re.compile('|'.join(
+                ['(?:%s)' % f.pattern.pattern for f in self.filters]))
+
+    def run(self, lines):
+        """Filter method"""
+        return list(self.run_iter(lines))
+
+    def run_iter(self, lines):
+        """Streaming filter method: takes and yields an iterator of lines"""
+        if self.pattern is None:
+            for line in lines:
+                yield line
+            return
+
+        search = self.pattern.search
+        for line in lines:
+            if search(line):
+                line = self.rewrite(line)
+            yield line
+
+    def run_buffer(self, buf):
+        """In-place filter method: changes a PageBuffer and returns it"""
+        if self.pattern is not None:
+            buf.rewrite(self.pattern.search, self.rewrite)
+        return buf
+
+    def rewrite(self, line):
+        """Rewrites a single line"""
+        for f in self.filters:
+            line = f.rewrite(line)
+
+        return line
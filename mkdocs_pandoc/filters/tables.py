@@ -22,50 +22,68 @@ import re
 import string
 import textwrap
 
+try:
+    from itertools import zip_longest
+except ImportError:
+    from itertools import izip_longest as zip_longest
+
+# Matches a link at the start of a word, capturing its title
+LINK_RE = re.compile(r'\[(.*?)\]\(.*?\)')
+
 class TableFilter(tbl.TableProcessor):
     def __init__(self, width=100, encoding='utf-8'):
         self.width = width
         self.width_default = 20   # Default column width for rogue rows with more cells than the first row.
+        self.in_fence = False
+        self.reset_wrap_cache()
 
 
     def blocks(self, lines):
-        """Groups lines into markdown blocks"""
+        """Groups lines into markdown blocks (lists of lines)"""
+        return list(self.iter_blocks(lines))
+
+
+    def iter_blocks(self, lines):
+        """Groups lines into markdown blocks (lists of lines), yielding each
+        block as soon as it is complete."""
         state = markdown.blockparser.State()
-        blocks = []
+        block = None
 
-        # We use three states: start, ``` and '\n'
+        # We use three states: start, ``` and '' (end of block at empty line)
         state.set('start')
 
-        # index of current block
-        currblock = 0
-
         for line in lines:
-            line += '\n'
             if state.isstate('start'):
                 if line[:3] == '```':
                     state.set('```')
                 else:
-                    state.set('\n')
-                blocks.append('')
-                currblock = len(blocks) - 1
+                    state.set('')
+                block = [line]
             else:
-                marker = line[:3]  # Will capture either '\n' or '```'
+                block.append(line)
+                marker = line[:3]  # Will capture either '' or '```'
                 if state.isstate(marker):
                     state.reset()
-            blocks[currblock] += line
+                    yield block
+                    block = None
 
-        return blocks
+        # Lets callers processing a document in pieces know whether a code
+        # block continues into the next piece.
+        self.in_fence = state.isstate('```')
+
+        if block is not None:
+            yield block
 
 
     def convert_table(self, block):
-        """"Converts a table to grid table format"""
-        lines_orig = block.split('\n')
-        lines_orig.pop() # Remove extra newline at end of block
+        """"Converts a table to grid table format. Takes a block as a list of
+        lines."""
+        lines_orig = block
         widest_cell = [] # Will hold the width of the widest cell for each column
         widest_word = [] # Will hold the width of the widest word for each column
         widths = []      # Will hold the computed widths of grid table columns
 
-        rows = []   # Will hold table cells during processing
+        rows = []   # Will hold table cells during processing (row-wise)
         lines = []  # Will hold the finished table
 
         has_border = False  # Will be set to True if this is a bordered table
@@ -80,43 +98,27 @@ class TableFilter(tbl.TableProcessor):
 
         # Only process tables, leave everything else untouched
 
-        if not self.test(None, block):
+        if not self.is_candidate(block):
+            return lines_orig
+
+        if not self.test(None, '\n'.join(block) + '\n'):
             return lines_orig
 
         if lines_orig[0].startswith('|'):
             has_border = True
 
-        # Initialize width arrays
+        # Parse lines into array of cells
 
-        for i in range(0, len(self._split_row(lines_orig[0], has_border))):
-            widest_cell.append(0)
-            widest_word.append(0)
-            widths.append(0)
+        for line in lines_orig:
+            rows.append(self._split_row(line, has_border))
 
-        # Parse lines into array of cells and record width of widest cell/word
+        # Record width of widest cell/word column by column. Rows may have
+        # differing numbers of cells, missing cells count as empty.
 
-        for line in lines_orig:
-            row = self._split_row(line, has_border)
-            # pad widest_cell to account for under length first row
-            for i in range(0, len(row) - len(widest_cell)):
-                widest_cell.append(0)
-                widest_word.append(0)
-                widths.append(0)
-            for i in range(0, len(row)):
-                # Record cell width
-                if len(row[i]) > widest_cell[i]:
-                    widest_cell[i] = len(row[i])
-                # Record longest word
-                words = row[i].split()
-                for word in words:
-                    # Keep URLs from throwing the word length count off too badly.
-                    match = re.match(r'\[(.*?)\]\(.*?\)', word)
-                    if match:
-                       word = match.group(1)
-
-                    if len(word) > widest_word[i]:
-                        widest_word[i] = len(word)
-            rows.append(row)
+        for column in zip_longest(*rows, fillvalue=''):
+            widest_cell.append(max([len(cell) for cell in column]))
+            widest_word.append(max([self.widest_word(cell) for cell in column]))
+            widths.append(0)
 
         # Remove table header divider line from rows
         rows.pop(1)
@@ -151,6 +153,9 @@ class TableFilter(tbl.TableProcessor):
 
         lines.append(self.ruler_line(widths, linetype='-'))
 
+        # Wrapped cells are cached per table only
+        self.reset_wrap_cache()
+
         # Only add header row if it contains more than just whitespace
         if ''.join(rows[0]).strip() != '':
                 lines.extend(self.wrap_row(widths, rows[0]))
@@ -169,14 +174,49 @@ class TableFilter(tbl.TableProcessor):
         return lines
 
 
+    def is_candidate(self, block):
+        """Cheap pre-screen for tables: a table's first line contains a pipe
+        and its second line is a divider row. This only checks conditions
+        TableProcessor.test() requires as well, so blocks failing it can be
+        passed through without calling test()."""
+        if len(block) < 2:
+            return False
+
+        header = block[0]
+        divider = block[1]
+
+        return ('|' in header and '|' in divider and '-' in divider and
+                divider.strip()[:1] in ('|', ':', '-'))
+
+
+    def widest_word(self, cell):
+        """Returns the length of the longest word in a cell"""
+        widest = 0
+
+        for word in cell.split():
+            # Keep URLs from throwing the word length count off too badly.
+            if word[:1] == '[':
+                match = LINK_RE.match(word)
+                if match:
+                    word = match.group(1)
+
+            if len(word) > widest:
+                widest = len(word)
+
+        return widest
+
+
     def run(self, lines):
         """Filter method: Passes all blocks through convert_table() and returns a list of lines."""
-        ret = []
+        return list(self.run_iter(lines))
 
-        for block in self.blocks(lines):
-            ret.extend(self.convert_table(block))
 
-        return ret
+    def run_iter(self, lines):
+        """Streaming filter method: Passes blocks through convert_table() as
+        they are completed and yields the resulting lines."""
+        for block in self.iter_blocks(lines):
+            for line in self.convert_table(block):
+                yield line
 
 
     def ruler_line(self, widths, linetype='-'):
@@ -187,9 +227,37 @@ class TableFilter(tbl.TableProcessor):
         return '+' + '+'.join(cells) + '+'
 
 
+    def reset_wrap_cache(self):
+        """Discards cached text wrappers and wrapped cells"""
+        self.wrappers = {}  # column width -> TextWrapper
+        self.wrapped = {}   # (cell text, column width) -> list of lines
+
+
+    def wrap_cell(self, text, width):
+        """Wraps a cell's text to `width` and pads each line with spaces to the
+        full width. Returns a list of lines which must not be modified, since
+        it is cached for identical cells."""
+        key = (text, width)
+        cell = self.wrapped.get(key)
+
+        if cell is None:
+            tw = self.wrappers.get(width)
+            if tw is None:
+                tw = textwrap.TextWrapper(width=width, break_on_hyphens=False)
+                self.wrappers[width] = tw
+
+            # Wrap, left-justify and pad with spaces up to fixed column width
+            cell = ['%-*s' % (width, l) for l in tw.wrap(textwrap.dedent(text))]
+            self.wrapped[key] = cell
+
+        return cell
+
+
     def wrap_row(self, widths, row, width_default=None):
         """Wraps a single line table row into a fixed width, multi-line table."""
         lines = []
+        cells = []  # wrapped column contents
+        pads = []   # empty line for each column
         longest = 0 # longest wrapped column in row
 
         if not width_default:
@@ -203,31 +271,20 @@ class TableFilter(tbl.TableProcessor):
             if i < len(widths):
               w = widths[i]
 
-            tw = textwrap.TextWrapper(width=w, break_on_hyphens=False)
-            # Wrap and left-justify
-            row[i] = tw.wrap(textwrap.dedent(row[i]))
-            # Pad with spaces up to to fixed column width
-            for l in range(0, len(row[i])):
-                    row[i][l] += (w - len(row[i][l])) * ' '
-            if len(row[i]) > longest:
-                longest = len(row[i])
+            cell = self.wrap_cell(row[i], w)
+            cells.append(cell)
+            pads.append(w * ' ')
+            if len(cell) > longest:
+                longest = len(cell)
 
         # Pad all columns to have the same number of lines
-        for i in range(0, len(row)):
-            w=width_default # column width
-
-            # Only set column width dynamicaly for non-rogue rows
-            if i < len(widths):
-                w = widths[i]
-
-            if len(row[i]) < longest:
-                for j in range(len(row[i]), longest):
-                    row[i].append(w * ' ')
-
         for l in range(0,longest):
             line = []
-            for c in range(len(row)):
-                line.append(row[c][l])
+            for c in range(len(cells)):
+                if l < len(cells[c]):
+                    line.append(cells[c][l])
+                else:
+                    line.append(pads[c])
             line = '| ' + ' | '.join(line) + ' |'
             lines.append(line)
 
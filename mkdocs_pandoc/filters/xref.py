@@ -13,25 +13,176 @@
 # limitations under the License.
 #
 
+import posixpath
 import re
+import unicodedata
+
+from mkdocs_pandoc.lineindex import LineIndex
+
+# Markup pandoc leaves out of a header's text when deriving its identifier:
+# HTML tags, and links and images (which keep their text)
+TAG_RE = re.compile(r'<[^>]*>')
+LINK_RE = re.compile(r'!?\[([^\]]*)\]\([^)]*\)')
+
+# ATX header markup: leading and optional closing hashes
+HEADER_RE = re.compile(r'^#+\s*|\s+#+\s*$')
+
+
+def pandoc_identifier(text):
+    """Computes the identifier pandoc's auto_identifiers extension derives from
+    a header's text"""
+    text = LINK_RE.sub(r'\1', TAG_RE.sub('', text))
+
+    # Keep only alphanumerics, underscores, hyphens, periods and whitespace
+    text = ''.join([c for c in text
+                    if c.isalnum() or c in '_-.' or c.isspace()])
+
+    # Join words by hyphens and drop everything up to the first letter
+    ident = '-'.join(text.split()).lower()
+    for i in range(len(ident)):
+        if ident[i].isalpha():
+            return ident[i:]
+
+    return 'section'
+
+
+def markdown_slug(text):
+    """Computes the identifier python-markdown's toc extension (and thus
+    mkdocs) derives from a header's text"""
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+
+    text = LINK_RE.sub(r'\1', TAG_RE.sub('', text))
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore')
+    text = re.sub(r'[^\w\s-]', '', text.decode('ascii')).strip().lower()
+    return re.sub(r'[-\s]+', '-', text)
+
+
+def page_headers(lines):
+    """Returns the text of the ATX headers outside fenced code blocks in a
+    page's lines, in order"""
+    return [HEADER_RE.sub('', lines[i]) for i in LineIndex(lines).headers]
 
-# TODO: Implement working cross-references (for now they are simply replaced by
-#       their link titles).
 
 class XrefFilter(object):
-    """Replaces mkdocs style cross-references by just their title"""
+    """Turns mkdocs style cross-references into pandoc internal links.
+
+    Links to pages listed in `pages` (a flattened pages data structure) point
+    to the chapter heading ChapterheadFilter inserts for that page, links
+    with a fragment point to the header in that page the fragment refers to.
+    `headers` holds the text of every header in the document, as a list per
+    page (see page_headers()) starting with the chapter heading; the
+    identifiers pandoc gives them depend on all headers before them. Without
+    `headers` only the chapter headings are known.
+
+    Since this filter does not know which page a line came from, relative
+    link targets are resolved by matching path suffixes; links that cannot
+    be resolved unambiguously are replaced by just their title."""
+
+    # Link title (which may contain brackets, e.g. for images), target file
+    # and optional fragment.
+    pattern = re.compile(
+            r'\[((?:[^\[\]]|\[[^\]]*\])*)\]\(([^)\s]*?\.md)(#[^)\s]*)?\)')
+    url_pattern = re.compile(r'\w+://')
+
+    def __init__(self, **kwargs):
+        self.pages = kwargs.get('pages', [])
+        self.headers = kwargs.get('headers', None)
+        if self.headers is None:
+            self.headers = [[page['title']] for page in self.pages]
+        self.index = self.build_index(self.pages, self.headers)
+
+    def build_index(self, pages, headers):
+        """Builds a dictionary mapping every path suffix of the pages' file
+        names to a (identifier of the chapter heading, fragments) tuple,
+        where fragments maps the python-markdown identifiers of the page's
+        headers to their pandoc identifiers. Suffixes shared by several pages
+        map to None."""
+        index = {}
+        used = set()  # pandoc identifiers of all headers so far
+
+        for page, texts in zip(pages, headers):
+            idents = []
+            for text in texts:
+                ident = pandoc_identifier(text)
+
+                # pandoc disambiguates duplicate identifiers by appending the
+                # first number not yet taken
+                if ident in used:
+                    n = 1
+                    while '%s-%d' % (ident, n) in used:
+                        n += 1
+                    ident = '%s-%d' % (ident, n)
+
+                used.add(ident)
+                idents.append(ident)
+
+            # The chapter heading's text is the title, not a header of the
+            # page itself.
+            fragments = {}
+            for text, ident in zip(texts[1:], idents[1:]):
+                slug = markdown_slug(text)
+
+                # python-markdown disambiguates duplicates within a page by
+                # appending _1, _2 and so on
+                unique, n = slug, 0
+                while unique in fragments or not unique:
+                    n += 1
+                    unique = '%s_%d' % (slug, n)
+
+                fragments[unique] = ident
+
+            entry = (idents[0] if idents else None, fragments)
+
+            parts = page['file'].replace('\\', '/').split('/')
+            for i in range(len(parts)):
+                suffix = '/'.join(parts[i:])
+                if suffix in index and index[suffix] is not entry:
+                    index[suffix] = None
+                else:
+                    index[suffix] = entry
+
+        return index
+
+    def lookup(self, target, fragment=None):
+        """Returns the identifier of the header a link target (and fragment,
+        without the leading #) refers to, or None"""
+        target = posixpath.normpath(target)
+        while target.startswith('../'):
+            target = target[3:]
+
+        entry = self.index.get(target)
+        if entry is None:
+            return None
+
+        if fragment:
+            return entry[1].get(fragment)
+
+        return entry[0]
 
     def run(self, lines):
         """Filter method"""
-        ret = []
+        return list(self.run_iter(lines))
+
+    def run_iter(self, lines):
+        """Streaming filter method: takes and yields an iterator of lines"""
         for line in lines:
-            while True:
-                match = re.search(r'\[(.*?)\]\((.*?\.md)\)', line)
-                if match != None:
-                    title = match.group(1)
-                    line = re.sub(r'\[.*?\]\(.*?\.md\)', title, line, count=1)
-                else:
-                    break
-            ret.append(line)
+            yield self.rewrite(line)
+
+    def rewrite(self, line):
+        """Rewrites a single line"""
+        return self.pattern.sub(self.rewrite_link, line)
+
+    def rewrite_link(self, match):
+        """Replacement callback for a single cross-reference"""
+        title, target, fragment = match.groups()
+
+        # Links to other sites are left alone
+        if self.url_pattern.match(target):
+            return match.group(0)
+
+        ident = self.lookup(target, fragment and fragment[1:])
+        if ident is None:
+            return title
 
-        return ret
+        return '[%s](#%s)' % (title, ident)
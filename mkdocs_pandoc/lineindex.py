@@ -0,0 +1,88 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Classification of a page's lines, shared by the per-page filters"""
+
+import array
+import itertools
+import re
+
+# Fenced code blocks start and end with lines starting with ``` or ~~~
+FENCE_RE = re.compile(r'```|~~~')
+
+# Lines starting fenced code blocks or ATX headers
+START_RE = re.compile(r'(```|~~~)|(#+)')
+
+IMAGE_RE = re.compile(r'!\[')
+
+
+class FenceTracker(object):
+    """Tracks whether a sequence of lines is inside a fenced code block. A
+    block ends at the first line starting with the marker (``` or ~~~) it
+    started with."""
+
+    def __init__(self):
+        self.marker = None
+
+    def update(self, line):
+        """Processes the next line. Returns True if the line opens, closes
+        or is inside a fenced code block."""
+        m = FENCE_RE.match(line)
+
+        if self.marker is None:
+            if m:
+                self.marker = m.group(0)
+                return True
+            return False
+
+        if m and m.group(0) == self.marker:
+            self.marker = None
+
+        return True
+
+
+class LineIndex(object):
+    """Classification of a list of lines, built once per page rather than by
+    every filter. Lines are identified by their index. The index records
+
+    - `headers`: the ATX headers outside fenced code blocks
+    - `images`: the lines containing an image ('![')
+
+    Both are sorted arrays of integers."""
+
+    __slots__ = ('headers', 'images')
+
+    def __init__(self, lines):
+        self.headers = array.array('i')
+        self.images = array.array('i')
+
+        # Lines are matched with map() and only the matching ones are looked
+        # at in Python, which keeps classifying cheap for the many lines that
+        # are none of the above.
+        starts = list(map(START_RE.match, lines))
+        marker = None # marker of the fenced code block currently open
+
+        for lineno, m in itertools.compress(enumerate(starts), starts):
+            fence = m.group(1)
+            if fence:
+                if marker is None:
+                    marker = fence
+                elif fence == marker:
+                    marker = None
+            elif marker is None:
+                self.headers.append(lineno)
+
+        self.images.extend(itertools.compress(itertools.count(),
+                                              map(IMAGE_RE.search, lines)))
+
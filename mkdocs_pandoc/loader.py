@@ -0,0 +1,110 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Page loaders: where PandocConverter reads page sources from.
+
+A loader provides read(name), returning the text of the page `name` (a file
+name from mkdocs.yml, relative to docs_dir) and lines(name), returning it as
+a list of lines with trailing whitespace removed. Both raise FatalError if
+the page cannot be read."""
+
+import codecs
+import io
+import mmap
+import os
+
+from mkdocs_pandoc.exceptions import FatalError
+
+# Files at least this large are read through mmap
+MMAP_THRESHOLD = 1024 * 1024
+
+
+def split_lines(text):
+    """Splits text into lines and removes trailing whitespace from them"""
+    return list(map(type(text).rstrip, text.splitlines()))
+
+
+def decoder(encoding):
+    """Returns a function decoding bytes in `encoding`. UTF-8 is decoded by
+    the built-in codec directly, skipping the codec registry lookup."""
+    if codecs.lookup(encoding).name == 'utf-8':
+        return lambda data: codecs.utf_8_decode(data, 'strict', True)[0]
+
+    decode = codecs.getdecoder(encoding)
+    return lambda data: decode(data)[0]
+
+
+class LinesMixin(object):
+    """Provides lines() for loaders implementing read()"""
+
+    def lines(self, name):
+        return split_lines(self.read(name))
+
+
+class FileLoader(LinesMixin):
+    """Loads pages from files below `base_dir`. Files are read in one binary
+    read (or mapped into memory if at least `mmap_threshold` bytes large) and
+    decoded in one go."""
+
+    def __init__(self, base_dir, encoding='utf-8',
+                 mmap_threshold=MMAP_THRESHOLD):
+        self.base_dir = base_dir
+        self.encoding = encoding
+        self.mmap_threshold = mmap_threshold
+        self.decode = decoder(encoding)
+
+    def __getstate__(self):
+        # Decoding functions cannot be pickled
+        state = dict(self.__dict__)
+        del state['decode']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.decode = decoder(self.encoding)
+
+    def read(self, name):
+        fname = os.path.join(self.base_dir, name)
+        try:
+            with io.open(fname, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size and size >= self.mmap_threshold:
+                    # Decoding straight from the mapping saves copying the
+                    # file's content into a bytes object first.
+                    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        return self.decode(m)
+                    finally:
+                        m.close()
+                return self.decode(f.read())
+        except (IOError, OSError) as e:
+            raise FatalError("Couldn't open %s for reading: %s" % (fname,
+                e.strerror), 1)
+        except UnicodeDecodeError as e:
+            raise FatalError("Couldn't decode %s: %s" % (fname, e), 1)
+
+
+class DictLoader(LinesMixin):
+    """Loads pages from a dictionary mapping page names to their text, e.g.
+    for tests or generated documentation"""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def read(self, name):
+        try:
+            return self.pages[name]
+        except KeyError:
+            raise FatalError("Couldn't open %s for reading: No such page" %
+                    name, 1)
@@ -0,0 +1,129 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Helpers for writing converted documents"""
+
+import errno
+import io
+import itertools
+import os
+import shutil
+import tempfile
+
+from mkdocs_pandoc.exceptions import FatalError
+
+# Number of lines joined, encoded and written at once
+CHUNK_LINES = 4096
+
+
+def chunks(lines, encoding='utf-8', size=CHUNK_LINES):
+    """Joins an iterator of lines into newline terminated chunks of up to
+    `size` lines and yields them encoded."""
+    lines = iter(lines)
+    while True:
+        chunk = list(itertools.islice(lines, size))
+        if not chunk:
+            return
+        chunk.append('')
+        yield '\n'.join(chunk).encode(encoding)
+
+
+def write_lines(out, lines, encoding='utf-8'):
+    """Writes lines to the binary file object `out` in chunks. `out` is
+    flushed after every chunk, so a process reading from a pipe receives the
+    document while later lines are still being produced."""
+    write_chunks(out, chunks(lines, encoding))
+
+
+def write_chunks(out, encoded):
+    """Like write_lines(), but takes an iterator of encoded chunks"""
+    for chunk in encoded:
+        out.write(chunk)
+        out.flush()
+
+
+def write_atomic(filename, lines, encoding='utf-8'):
+    """Writes lines to `filename` through a temporary file in the same
+    directory which then replaces `filename`, so readers never see a
+    partially written file."""
+    write_chunks_atomic(filename, chunks(lines, encoding))
+
+
+def write_chunks_atomic(filename, encoded):
+    """Like write_atomic(), but takes an iterator of encoded chunks"""
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=dirname,
+            prefix='.' + os.path.basename(filename) + '.')
+
+    try:
+        with io.open(fd, 'wb') as out:
+            for chunk in encoded:
+                out.write(chunk)
+
+        # mkstemp() creates files only readable by their owner
+        if os.path.exists(filename):
+            shutil.copymode(filename, tmp)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+
+        if hasattr(os, 'replace'):
+            os.replace(tmp, filename)
+        else:
+            os.rename(tmp, filename)
+    except:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def write_pipe(command, lines, encoding='utf-8'):
+    """Runs `command` (a list of program and arguments) and writes lines to
+    its standard input as they are produced. Returns the command's exit
+    status. The command is terminated if producing the lines fails."""
+    return write_chunks_pipe(command, chunks(lines, encoding))
+
+
+def write_chunks_pipe(command, encoded):
+    """Like write_pipe(), but takes an iterator of encoded chunks"""
+    import subprocess
+
+    try:
+        proc = subprocess.Popen(command, stdin=subprocess.PIPE)
+    except OSError as e:
+        raise FatalError("Couldn't run %s: %s" % (command[0], e.strerror), 1)
+
+    try:
+        write_chunks(proc.stdin, encoded)
+    except (IOError, OSError) as e:
+        # The command exited without reading all of its input; its exit
+        # status tells why.
+        if e.errno != errno.EPIPE:
+            proc.terminate()
+            proc.wait()
+            raise
+    except:
+        proc.terminate()
+        proc.wait()
+        raise
+
+    try:
+        proc.stdin.close()
+    except (IOError, OSError):
+        pass
+
+    return proc.wait()
@@ -0,0 +1,139 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Flattening of the `pages`/`nav` data structure from mkdocs.yml"""
+
+import os
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+class Page(object):
+    """A page from the flattened pages data structure: its source file
+    (relative to docs_dir), title and nesting level (1 for top level pages).
+    Fields can also be accessed as page['file'] etc."""
+
+    __slots__ = ('file', 'title', 'level')
+
+    def __init__(self, file, title, level):
+        self.file = file
+        self.title = title
+        self.level = level
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __reduce__(self):
+        return (Page, (self.file, self.title, self.level))
+
+    def __repr__(self):
+        return 'Page(%r, %r, %r)' % (self.file, self.title, self.level)
+
+
+class PageList(list):
+    """List of Page objects which also records the deepest nesting level
+    (`max_level`) and where each chapter starts (`chapters`, a list of
+    (title, index of first page) tuples). Every top level entry containing
+    pages is a chapter: a page, or a section with its subsections."""
+
+    max_level = 0
+    chapters = ()
+
+    def chapter_pages(self):
+        """Returns a list of (title, pages) tuples, one per chapter"""
+        starts = [start for title, start in self.chapters] + [len(self)]
+        return [(self.chapters[i][0], self[starts[i]:starts[i + 1]])
+                for i in range(len(self.chapters))]
+
+
+def filename_to_title(filename):
+    """Derives a title for a page listed without one the way mkdocs does:
+    from its file name, capitalized if all lower case"""
+    if filename == 'index.md':
+        return 'Home'
+
+    title = os.path.splitext(os.path.basename(filename))[0]
+    title = title.replace('-', ' ').replace('_', ' ')
+    if title.lower() == title:
+        title = title.capitalize()
+
+    return title
+
+
+def flatten(entries, level=1):
+    """Flattens a `pages` or `nav` data structure into a PageList. Entries
+    may be [file, title] lists (legacy `pages` syntax), {title: file}
+    dictionaries, bare file names, or {title: [...]} sections whose entries
+    are one level deeper. Links to external URLs are skipped."""
+    flattened = PageList()
+    append = flattened.append
+    max_level = 0
+    chapters = []
+
+    # The stack holds the iterators of all sections being flattened; a
+    # section's iterator is resumed once its subsections are done.
+    stack = [(iter(entries), level)]
+
+    while stack:
+        entries, level = stack[-1]
+
+        for entry in entries:
+            # Top level entries start chapters; the ones without pages are
+            # dropped below.
+            if len(stack) == 1:
+                chapter = len(chapters)
+                chapters.append([None, len(flattened)])
+
+            if isinstance(entry, dict):
+                if not entry:
+                    continue
+                title, file = next(iter(entry.items()))
+                if isinstance(file, list):
+                    if len(stack) == 1:
+                        chapters[chapter][0] = title
+                    stack.append((iter(file), level + 1))
+                    break
+            elif isinstance(entry, list):
+                file, title = entry[0], entry[1]
+            else:
+                file, title = entry, None
+
+            if not isinstance(file, string_types) or '://' in file:
+                continue
+
+            if title is None:
+                title = filename_to_title(file)
+
+            append(Page(file, title, level))
+
+            if chapters[chapter][0] is None:
+                chapters[chapter][0] = title
+
+            if level > max_level:
+                max_level = level
+        else:
+            stack.pop()
+
+    flattened.max_level = max_level
+    ends = [start for title, start in chapters[1:]] + [len(flattened)]
+    flattened.chapters = [(title, start) for (title, start), end
+                          in zip(chapters, ends) if start < end]
+
+    return flattened
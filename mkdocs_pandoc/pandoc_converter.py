@@ -1,40 +1,48 @@
+import mkdocs_pandoc.config
 import mkdocs_pandoc.filters.anchors
 import mkdocs_pandoc.filters.chapterhead
 import mkdocs_pandoc.filters.headlevels
 import mkdocs_pandoc.filters.images
 import mkdocs_pandoc.filters.exclude
-import mkdocs_pandoc.filters.include
-import mkdocs_pandoc.filters.tables
+import mkdocs_pandoc.filters.rewrite
 import mkdocs_pandoc.filters.toc
 import mkdocs_pandoc.filters.xref
+import mkdocs_pandoc.pages
+# Not imported here: the include and table filters, which pull in
+# python-markdown, and modules only needed for optional features. The
+# methods needing them import them, which keeps startup fast for small
+# conversions.
 
+from mkdocs_pandoc.buffer import PageBuffer
 from mkdocs_pandoc.exceptions import FatalError
+from mkdocs_pandoc.loader import FileLoader
 
-import codecs
+import io
 import os
-import yaml
+import time
 
 
 class PandocConverter:
     """Top level converter class. Instatiate separately for each mkdocs.yml."""
 
     def __init__(self, **kwargs):
+        self.base_dir = kwargs.get('base_dir', None)
+        self.cache_dir = kwargs.get('cache_dir', None)
+        self.cache_size = kwargs.get('cache_size', 100 * 1024 * 1024)
         self.config_file = kwargs.get('config_file', 'mkdocs.yml')
         self.encoding = kwargs.get('encoding', 'utf-8')
         self.exclude = kwargs.get('exclude', None)
         self.filter_tables = kwargs.get('filter_tables', True)
         self.filter_xrefs = kwargs.get('filter_xrefs', True)
         self.image_ext = kwargs.get('image_ext', None)
+        self.include_cache = kwargs.get('include_cache', None)
+        self.jobs = kwargs.get('jobs', 1)
+        self.loader = kwargs.get('loader', None)
+        self.stats = kwargs.get('stats', None)
         self.strip_anchors = kwargs.get('strip_anchors', True)
         self.width = kwargs.get('width', 100)
 
-        try:
-            cfg = codecs.open(self.config_file, 'r', self.encoding)
-        except IOError as e:
-            raise FatalError("Couldn't open %s for reading: %s" % (self.config_file,
-                e.strerror), 1)
-
-        self.config = yaml.load(cfg)
+        self.config, self.pages = self.load_config()
 
         if not 'docs_dir' in self.config:
             self.config['docs_dir'] = 'docs'
@@ -42,6 +50,14 @@ class PandocConverter:
         if not 'site_dir' in  self.config:
             self.config['site_dir'] = 'site'
 
+        # Relative directories are relative to the working directory unless
+        # a base directory is given.
+        if self.base_dir:
+            for d in ('docs_dir', 'site_dir'):
+                self.config[d] = os.path.join(self.base_dir, self.config[d])
+
+        self._include_graph = None
+
         # Set filters depending on markdown extensions from config
         # Defaults first...
         self.filter_include = False
@@ -63,105 +79,493 @@ class PandocConverter:
               if extname == 'toc':
                   self.filter_toc = True
 
-        cfg.close()
+    def load_config(self):
+        """Reads the configuration file. Returns a copy of the configuration
+        and the flattened pages. Both are cached by the file's content, in
+        memory and, if cache_dir is set, on disk, so unchanged configuration
+        files are not parsed again."""
+        try:
+            with io.open(self.config_file, 'rb') as f:
+                data = f.read()
+        except IOError as e:
+            raise FatalError("Couldn't open %s for reading: %s" % (self.config_file,
+                e.strerror), 1)
 
-    def flatten_pages(self, pages, level=1):
-        """Recursively flattens pages data structure into a one-dimensional data structure"""
-        flattened = []
+        key = mkdocs_pandoc.config.config_key(data, self.encoding)
+        entry = mkdocs_pandoc.config.default_cache.get(key)
 
-        for page in pages:
-            if type(page) is list:
-                flattened.append(
-                             {
-                                'file': page[0],
-                                'title': page[1],
-                                'level': level,
-                             })
-            if type(page) is dict:
-                if type(list(page.values())[0]) is str:
-                    flattened.append(
-                            {
-                                'file': list(page.values())[0],
-                                'title': list(page.keys())[0],
-                                'level': level,
-                             })
-                if type(list(page.values())[0]) is list:
-                    flattened.extend(
-                            self.flatten_pages(
-                                list(page.values())[0],
-                                level + 1)
-                            )
-
-
-        return flattened
+        page_cache = None
+        if entry is None and self.cache_dir:
+            from mkdocs_pandoc.cache import PageCache
+            page_cache = PageCache(self.cache_dir, self.cache_size)
+            entry = page_cache.get_object(key)
+
+        if entry is None:
+            try:
+                text = data.decode(self.encoding)
+            except UnicodeDecodeError as e:
+                raise FatalError("Couldn't decode %s: %s" % (self.config_file,
+                    e), 1)
+
+            config = mkdocs_pandoc.config.parse(text, self.config_file)
+
+            # mkdocs 1.0 renamed `pages` to `nav`
+            nav = config.get('nav', config.get('pages'))
+            if nav is None:
+                raise FatalError("%s has neither nav nor pages" %
+                        self.config_file, 1)
+
+            entry = (config, self.flatten_pages(nav))
+
+            if page_cache:
+                page_cache.put_object(key, entry)
+
+        mkdocs_pandoc.config.default_cache.put(key, entry)
+
+        # The cached entry is shared, so the configuration is copied before
+        # it is modified.
+        config, pages = entry
+        return dict(config), pages
+
+    @staticmethod
+    def convert_many(projects, jobs=1, **kwargs):
+        """Converts several mkdocs projects in one process (or a pool of `jobs`
+        worker processes, 0 meaning one per CPU). `projects` is a list of
+        (config_file, outfile) tuples; each project's directories are
+        relative to its configuration file's location. Remaining keyword
+        arguments are passed to PandocConverter. Returns a list of
+        (config_file, outfile, seconds, error) tuples in the order of
+        `projects`, where error is None or an error message."""
+        tasks = [(config_file, outfile, kwargs)
+                 for config_file, outfile in projects]
+
+        import multiprocessing
+
+        if jobs == 0:
+            jobs = multiprocessing.cpu_count()
+
+        if jobs and jobs > 1 and len(tasks) > 1:
+            # Worker processes cannot have worker processes of their own.
+            kwargs['jobs'] = 1
+            pool = multiprocessing.Pool(jobs)
+            try:
+                return pool.map(_convert_project, tasks, chunksize=1)
+            finally:
+                pool.terminate()
+                pool.join()
+
+        return [_convert_project(task) for task in tasks]
+
+    def flatten_pages(self, pages, level=1):
+        """Flattens a pages (or nav) data structure into a list of Page
+        records. See mkdocs_pandoc.pages.flatten()."""
+        return mkdocs_pandoc.pages.flatten(pages, level)
 
     def convert(self):
         """User-facing conversion method. Returns pandoc document as a list of
         lines."""
-        lines = []
-
-        pages = self.flatten_pages(self.config['pages'])
-
-        f_exclude = mkdocs_pandoc.filters.exclude.ExcludeFilter(
-                exclude=self.exclude)
+        return list(self.convert_iter())
+
+    def convert_iter(self):
+        """Streaming conversion method. Returns an iterator over the lines of
+        the pandoc document. Pages are read and filtered lazily, so memory
+        use is bounded by the largest page or table rather than the whole
+        document. Nothing is read before the first line is requested."""
+        pages = self.pages
+        filters = self.document_filters(pages, self.page_headers(pages))
+
+        lines = self.measure_document(lambda: self.iter_pages(pages),
+                                      filters, 'pages')
+
+        for line in lines:
+            yield line
+
+    def convert_chapters(self):
+        """Converts the document in chapters, one per top level entry of the
+        pages data structure (see mkdocs_pandoc.pages.PageList). Yields a
+        (title, pages, lines) tuple for each chapter; together the chapters'
+        lines are the document convert() returns. A chapter is merged with
+        the next one if a code block continues into it."""
+        pages = self.pages
+        filters = self.document_filters(pages, self.page_headers(pages))
+        processed = self.iter_processed(pages)
+        chapters = pages.chapter_pages()
+
+        title, members, lines = None, [], []
+
+        for i in range(len(chapters)):
+            if title is None:
+                title = chapters[i][0]
+
+            for page in chapters[i][1]:
+                members.append(page)
+                lines.extend(next(processed))
+                lines.append('')
+
+            # Document filters are applied to chapters individually. This
+            # yields the same lines as applying them to the whole document,
+            # since every page starts with its chapter heading, unless a code
+            # block continues into the next chapter.
+            document = list(self.measure_document(lambda: iter(lines),
+                                                  filters, 'chapter'))
+
+            if i < len(chapters) - 1 and True in [getattr(f, 'in_fence', False)
+                                                  for f in filters]:
+                continue
+
+            yield title, members, document
+            title, members, lines = None, [], []
+
+        # Finishes processing (e.g. pruning the page cache)
+        for lines in processed:
+            pass
+
+    def page_headers(self, pages):
+        """Returns the headers of every page (see PageProcessor.headers()) if
+        cross-references are filtered, or None. A cross-reference may point
+        to any header in the document, so they are collected in a first
+        pass over the pages, which skips all other processing."""
+        if not self.filter_xrefs:
+            return None
+
+        processor = PageProcessor(self, pages)
+
+        if self.stats is None:
+            return [processor.headers(page) for page in pages]
+
+        from mkdocs_pandoc.stats import measure
+        headers = []
+        for page in pages:
+            texts, record = measure('page', 'headers', page['file'],
+                                    lambda: processor.headers(page), 0)
+            self.stats.add(record)
+            headers.append(texts)
 
-        f_include = mkdocs_pandoc.filters.include.IncludeFilter(
-                base_path=self.config['docs_dir'],
-                encoding=self.encoding)
+        return headers
 
-        # First, do the processing that must be done on a per-file basis:
-        # Adjust header levels, insert chapter headings and adjust image paths.
+    def document_filters(self, pages, headers=None):
+        """Returns the filters applied to the whole document (as opposed to
+        individual pages), in order. `headers` holds the headers of every
+        page, which cross-references are resolved against."""
+        filters = []
 
-        f_headlevel = mkdocs_pandoc.filters.headlevels.HeadlevelFilter(pages)
+        # Strip anchor tags, fix cross references and strip [TOC] keywords in
+        # a single pass.
+        line_filters = []
 
-        for page in pages:
-            fname = os.path.join(self.config['docs_dir'], page['file'])
-            try:
-                p = codecs.open(fname, 'r', self.encoding)
-            except IOError as e:
-                raise FatalError("Couldn't open %s for reading: %s" % (fname,
-                    e.strerror), 1)
-            f_chapterhead = mkdocs_pandoc.filters.chapterhead.ChapterheadFilter(
-                    headlevel=page['level'],
-                    title=page['title']
-                    )
-
-            f_image = mkdocs_pandoc.filters.images.ImageFilter(
-                    filename=page['file'],
-                    image_path=self.config['site_dir'],
-                    image_ext=self.image_ext)
-
-            lines_tmp = []
-
-            for line in p.readlines():
-                lines_tmp.append(line.rstrip())
-
-            if self.exclude:
-                lines_tmp = f_exclude.run(lines_tmp)
-
-            if self.filter_include:
-                lines_tmp = f_include.run(lines_tmp)
-
-            lines_tmp = f_headlevel.run(lines_tmp)
-            lines_tmp = f_chapterhead.run(lines_tmp)
-            lines_tmp = f_image.run(lines_tmp)
-            lines.extend(lines_tmp)
-            # Add an empty line between pages to prevent text from a previous
-            # file from butting up against headers in a subsequent file.
-            lines.append('')
-
-        # Strip anchor tags
         if self.strip_anchors:
-            lines = mkdocs_pandoc.filters.anchors.AnchorFilter().run(lines)
+            line_filters.append(mkdocs_pandoc.filters.anchors.AnchorFilter())
 
-        # Fix cross references
         if self.filter_xrefs:
-            lines = mkdocs_pandoc.filters.xref.XrefFilter().run(lines)
+            line_filters.append(mkdocs_pandoc.filters.xref.XrefFilter(
+                    pages=pages, headers=headers))
 
         if self.filter_toc:
-            lines = mkdocs_pandoc.filters.toc.TocFilter().run(lines)
+            line_filters.append(mkdocs_pandoc.filters.toc.TocFilter())
+
+        filters.append(mkdocs_pandoc.filters.rewrite.RewriteFilter(
+                line_filters))
 
         if self.filter_tables:
-            lines = mkdocs_pandoc.filters.tables.TableFilter().run(lines)
+            from mkdocs_pandoc.filters.tables import TableFilter
+            filters.append(TableFilter(width=self.width))
+
+        return filters
+
+    def filter_document(self, lines, filters):
+        """Chains the filters returned by document_filters() onto an iterator
+        of lines"""
+        for f in filters:
+            lines = f.run_iter(lines)
+
+        return lines
+
+    def measure_document(self, source, filters, name):
+        """Like filter_document(), but takes a function returning the lines
+        (named `name` in statistics). If statistics are collected, every
+        stage of the chain is measured separately; per-page filters are
+        recorded by iter_processed()."""
+        if self.stats is None:
+            return self.filter_document(source(), filters)
+
+        from mkdocs_pandoc.stats import filter_name
+        return self.stats.measure_chain(
+                [source] + [f.run_iter for f in filters],
+                [name] + [filter_name(f) for f in filters])
+
+    def include_graph(self):
+        """Returns an IncludeGraph of all pages and the files they include.
+        Pages are identified by their path (docs_dir joined with the page's
+        file name), which is also how include statements are resolved. The
+        graph is built on the first call."""
+        if self._include_graph is None:
+            pages = self.pages
+            processor = PageProcessor(self, pages)
+            from mkdocs_pandoc.filters.include import IncludeGraph
+            graph = IncludeGraph()
+
+            for page in pages:
+                processor.add_to_graph(graph, page)
+
+            self._include_graph = graph
+
+        return self._include_graph
+
+    def iter_pages(self, pages):
+        """Reads the pages from a flattened pages data structure, performs the
+        processing that must be done on a per-file basis and returns an
+        iterator over the resulting lines. With `jobs` set to more than 1
+        pages are processed in a pool of worker processes (0 means one per
+        CPU)."""
+        return self.join_pages(self.iter_processed(pages))
+
+    def join_pages(self, processed):
+        """Joins the pages from an iterator over their lines into a single
+        iterator of lines"""
+        for lines in processed:
+            for line in lines:
+                yield line
+
+            # Add an empty line between pages to prevent text from a
+            # previous file from butting up against headers in a
+            # subsequent file.
+            yield ''
+
+    def iter_processed(self, pages):
+        """Like iter_pages(), but yields a list of lines for every page"""
+        processor = PageProcessor(self, pages)
+
+        pool = None
+        jobs = self.jobs
+
+        if jobs != 1 and len(pages) > 1:
+            import multiprocessing
+            if jobs == 0:
+                jobs = multiprocessing.cpu_count()
+            if jobs and jobs > 1:
+                pool = multiprocessing.Pool(jobs, _init_worker, (processor,))
+
+        if pool:
+            results = pool.imap(_process_page, pages)
+        else:
+            results = (processor.process_page(page) for page in pages)
 
-        return(lines)
+        try:
+            for lines, records in results:
+                for record in records or []:
+                    self.stats.add(record)
+
+                yield lines
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+
+        if processor.cache:
+            processor.cache.prune()
+
+
+class PageProcessor(object):
+    """Performs the processing that must be done on a per-file basis: Adjust
+    header levels, insert chapter headings and adjust image paths. Instances
+    are shipped to worker processes when pages are processed in parallel."""
+
+    def __init__(self, converter, pages):
+        self.docs_dir = converter.config['docs_dir']
+        self.site_dir = converter.config['site_dir']
+        self.encoding = converter.encoding
+        self.loader = converter.loader or FileLoader(self.docs_dir,
+                                                     self.encoding)
+        self.filter_include = converter.filter_include
+        self.image_ext = converter.image_ext
+        self.exclude = converter.exclude or []
+        self.stats = converter.stats is not None
+        self.trace_memory = self.stats and converter.stats.trace_memory
+
+        self.cache = None
+        if converter.cache_dir:
+            from mkdocs_pandoc.cache import PageCache
+            self.cache = PageCache(converter.cache_dir, converter.cache_size)
+
+        # Excluded include statements are removed before includes are
+        # resolved, with the exclude patterns as a pre-screen.
+        self.f_exclude = mkdocs_pandoc.filters.rewrite.RewriteFilter(
+                [mkdocs_pandoc.filters.exclude.ExcludeFilter(
+                    exclude=converter.exclude)])
+
+        self.f_include = None
+        if self.filter_include:
+            from mkdocs_pandoc.filters.include import IncludeFilter
+            self.f_include = IncludeFilter(
+                    base_path=self.docs_dir,
+                    encoding=self.encoding,
+                    cache=converter.include_cache)
+
+        # Includes must be resolved before header levels are adjusted.
+        self.f_headlevel = mkdocs_pandoc.filters.headlevels.HeadlevelFilter(
+                pages)
+        self.headlevel_offset = self.f_headlevel.offset
+
+    def path(self, page):
+        """Returns the path of a page's source file"""
+        return os.path.normpath(os.path.join(self.docs_dir, page['file']))
+
+    def add_to_graph(self, graph, page):
+        """Adds a page and the files it includes to an IncludeGraph"""
+        if not self.filter_include:
+            graph.add(self.path(page), [])
+            return
+
+        lines = self.f_exclude.run(self.loader.lines(page['file']))
+
+        self.f_include.add_to_graph(graph, self.path(page), lines)
+
+    def headers(self, page):
+        """Returns the text of the headers in a page's output, as
+        mkdocs_pandoc.filters.xref.page_headers() would find them: its
+        chapter heading, then its ATX headers once exclude and include
+        statements are resolved. Other per-page filters do not change
+        which lines are headers or their text, so they are skipped."""
+        lines = self.f_exclude.run(self.loader.lines(page['file']))
+
+        if self.filter_include:
+            lines = self.f_include.run(lines)
+
+        return mkdocs_pandoc.filters.xref.page_headers(
+                ['# ' + page['title'], ''] + lines)
+
+    def process_page(self, page):
+        """Processes a single page. Returns its lines and, if statistics are
+        collected, a list of statistics records."""
+        if not self.stats:
+            return self.process(page), None
+
+        records = []
+        return self.process(page, records), records
+
+    def process(self, page, records=None):
+        """Reads and filters a single page. Returns a list of lines. If a
+        list is passed in `records`, a statistics record for every filter
+        is appended to it."""
+        if records is not None:
+            from mkdocs_pandoc.stats import measure
+
+            def run(name, func, lines_in):
+                lines, record = measure('page', name, page['file'], func,
+                                        lines_in)
+                records.append(record)
+                return lines
+        else:
+            run = lambda name, func, lines_in: func()
+
+        lines = run('read', lambda: self.loader.lines(page['file']), 0)
+
+        if self.cache:
+            key = self.cache_key(page, lines)
+            cached = run('cache', lambda: self.cache.get(key), 0)
+            if cached is not None:
+                return cached
+
+        f_chapterhead = mkdocs_pandoc.filters.chapterhead.ChapterheadFilter(
+                headlevel=page['level'],
+                title=page['title']
+                )
+
+        f_image = mkdocs_pandoc.filters.images.ImageFilter(
+                filename=page['file'],
+                image_path=self.site_dir,
+                image_ext=self.image_ext)
+
+        # Steps are named for statistics. The exclude filter is a
+        # RewriteFilter, which would otherwise be named after the filters
+        # it combines (none without exclude patterns).
+        steps = [('exclude', self.f_exclude)]
+
+        if self.filter_include:
+            steps.append(('include', self.f_include))
+
+        steps.append(('headlevel', self.f_headlevel))
+        steps.append(('chapterhead', f_chapterhead))
+        steps.append(('image', f_image))
+
+        # The filters change the page in place; lines none of them touches
+        # are not copied.
+        buf = PageBuffer(lines)
+
+        if records is None:
+            for name, f in steps:
+                f.run_buffer(buf)
+        else:
+            for name, f in steps:
+                run(name, lambda: f.run_buffer(buf), len(buf))
+
+        lines = buf.tolist()
+
+        if self.cache:
+            self.cache.put(key, lines)
+
+        return lines
+
+    def cache_key(self, page, lines):
+        """Computes the cache key for a page from its content, the content of
+        the files it includes and all settings affecting per-page output."""
+        parts = [
+            page['file'],
+            page['title'],
+            str(page['level']),
+            str(self.headlevel_offset),
+            os.path.abspath(self.docs_dir),
+            # Image paths are made absolute
+            os.path.abspath(self.site_dir),
+            str(self.image_ext),
+            self.encoding,
+            '\t'.join(self.exclude),
+            str(self.filter_include),
+            '\n'.join(lines),
+        ]
+
+        # Included files are identified by their content as cached by the
+        # include filter, so they are not read again for computing the key.
+        if self.filter_include:
+            for include, text in self.f_include.dependencies(
+                    self.f_exclude.run(lines)):
+                parts.append(include)
+                parts.append(str(text is not None))
+                parts.append('\n'.join(text or []))
+
+        return self.cache.key(parts)
+
+
+def _convert_project(task):
+    """Converts a single project for PandocConverter.convert_many()"""
+    config_file, outfile, kwargs = task
+    start = time.time()
+    error = None
+
+    from mkdocs_pandoc.output import write_atomic
+
+    try:
+        pconv = PandocConverter(config_file=config_file,
+                base_dir=os.path.dirname(config_file), **kwargs)
+        write_atomic(outfile, pconv.convert_iter(), pconv.encoding)
+    except FatalError as e:
+        error = e.message
+    except (IOError, OSError) as e:
+        error = "Couldn't write %s: %s" % (outfile, e.strerror)
+
+    return (config_file, outfile, time.time() - start, error)
+
+
+# Worker process state for parallel page processing. The PageProcessor is
+# sent once per worker rather than once per page.
+_page_processor = None
+
+def _init_worker(processor):
+    global _page_processor
+    _page_processor = processor
+    if processor.trace_memory:
+        from mkdocs_pandoc.stats import start_tracing
+        start_tracing()
+
+def _process_page(page):
+    return _page_processor.process_page(page)
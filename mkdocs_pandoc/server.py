@@ -0,0 +1,301 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Conversion daemon: serves conversions over a Unix domain socket, keeping
+converters, parsed configurations and included files in memory between
+requests"""
+
+from __future__ import print_function
+
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from mkdocs_pandoc.exceptions import FatalError
+from mkdocs_pandoc.filters.include import IncludeCache
+from mkdocs_pandoc.output import chunks
+from mkdocs_pandoc.pandoc_converter import PandocConverter
+
+# Messages in both directions are frames: a kind byte and the payload's
+# length, followed by the payload.
+FRAME = struct.Struct('!cI')
+
+REQUEST = b'R' # client: converter arguments as JSON
+DATA = b'D'    # server: a chunk of the encoded document
+DONE = b'S'    # server: the document is complete
+ERROR = b'E'   # server: the conversion failed; message and status as JSON
+
+
+def send_frame(sock, kind, payload=b''):
+    sock.sendall(FRAME.pack(kind, len(payload)))
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_frame(f):
+    """Reads a frame from the file object `f`. Returns a (kind, payload)
+    tuple, or (None, None) if the connection was closed."""
+    header = f.read(FRAME.size)
+    if len(header) < FRAME.size:
+        return None, None
+
+    kind, length = FRAME.unpack(header)
+    payload = f.read(length)
+    if len(payload) < length:
+        return None, None
+
+    return kind, payload
+
+
+class Project(object):
+    """What the server keeps of a project between requests: its converter
+    (reused until the configuration file changes) and included files"""
+
+    def __init__(self):
+        self.converter = None
+        self.mtime = None
+        self.include_cache = IncludeCache()
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+
+
+class Server(object):
+    """Serves conversions on the Unix domain socket `socket_path`. Requests
+    are handled concurrently, one thread each. Projects not used for
+    `idle_timeout` seconds are evicted, as are the least recently used
+    ones beyond `max_projects`. Conversions use `jobs` worker processes."""
+
+    def __init__(self, socket_path, idle_timeout=600, max_projects=32,
+                 jobs=1):
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.max_projects = max_projects
+        self.jobs = jobs
+
+        self.projects = {}
+        self.lock = threading.Lock()
+
+    def project(self, key):
+        """Returns the Project registered for `key`, or a new one, which
+        add() registers once it has a converter"""
+        with self.lock:
+            project = self.projects.get(key)
+            if project is None:
+                return Project()
+            project.last_used = time.time()
+
+        return project
+
+    def add(self, key, project):
+        """Registers `project` for `key`, evicting the least recently used
+        projects beyond `max_projects`"""
+        with self.lock:
+            project.last_used = time.time()
+            self.projects[key] = project
+
+            while len(self.projects) > self.max_projects:
+                oldest = min(self.projects,
+                             key=lambda k: self.projects[k].last_used)
+                del self.projects[oldest]
+
+    def evict_idle(self):
+        """Evicts the projects idle for more than `idle_timeout` seconds"""
+        deadline = time.time() - self.idle_timeout
+
+        with self.lock:
+            for key in list(self.projects):
+                if self.projects[key].last_used < deadline:
+                    del self.projects[key]
+
+    def converter(self, args):
+        """Returns a PandocConverter for the converter arguments `args`,
+        reusing the project's converter unless its configuration file was
+        modified since. Projects are only kept once a converter could be
+        created for them."""
+        key = json.dumps(args, sort_keys=True)
+        project = self.project(key)
+
+        try:
+            mtime = os.stat(args.get('config_file', 'mkdocs.yml')).st_mtime
+        except OSError:
+            mtime = None
+
+        with project.lock:
+            if project.converter is None or mtime is None or \
+                    mtime != project.mtime:
+                kwargs = dict(args)
+                kwargs['include_cache'] = project.include_cache
+                kwargs['jobs'] = self.jobs
+                project.converter = PandocConverter(**kwargs)
+                project.mtime = mtime
+                self.add(key, project)
+
+            return project.converter
+
+    def handle(self, sock):
+        """Handles a single connection"""
+        f = sock.makefile('rb')
+        kind, payload = recv_frame(f)
+        if kind != REQUEST:
+            return
+
+        args = json.loads(payload.decode('utf-8'))
+        start = time.time()
+
+        try:
+            converter = self.converter(args)
+            for chunk in chunks(converter.convert_iter(),
+                                args.get('encoding', 'utf-8')):
+                if not self.send(sock, DATA, chunk):
+                    break
+            else:
+                self.send(sock, DONE)
+        except FatalError as e:
+            self.send_error(sock, e.message, e.status)
+        except Exception as e:
+            traceback.print_exc()
+            self.send_error(sock, 'Internal error: %s' % e, 1)
+
+        print("%8.2f s  %s" % (time.time() - start, args.get('config_file')),
+                file=sys.stderr)
+
+    def send(self, sock, kind, payload=b''):
+        """Sends a frame to the client. Returns False if the client went
+        away. Errors sending are told apart from errors converting (on
+        Python 3 both are OSErrors) by only catching them here."""
+        try:
+            send_frame(sock, kind, payload)
+        except socket.error:
+            return False
+        return True
+
+    def send_error(self, sock, message, status):
+        self.send(sock, ERROR, json.dumps(
+            {'message': message, 'status': status}).encode('utf-8'))
+
+    def reap(self):
+        """Evicts idle projects periodically"""
+        while True:
+            time.sleep(min(self.idle_timeout, 60))
+            self.evict_idle()
+
+    def serve_forever(self):
+        """Listens for requests until interrupted"""
+        if os.path.exists(self.socket_path):
+            # Only replace sockets no server listens on any more
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except socket.error:
+                os.remove(self.socket_path)
+            else:
+                raise FatalError("%s is in use by another server" %
+                        self.socket_path, 1)
+            finally:
+                probe.close()
+
+        daemon = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                daemon.handle(self.request)
+
+        # Requests make the server read any file it can, so only the owner
+        # may connect. The socket is created with these permissions rather
+        # than changed afterwards, so nobody else can connect in between.
+        umask = os.umask(0o077)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(self.socket_path,
+                                                            Handler)
+        except socket.error as e:
+            raise FatalError("Couldn't listen on %s: %s" % (self.socket_path,
+                e), 1)
+        finally:
+            os.umask(umask)
+
+        server.daemon_threads = True
+
+        try:
+            reaper = threading.Thread(target=self.reap)
+            reaper.daemon = True
+            reaper.start()
+
+            # Clean up on SIGTERM as well (only possible in the main thread)
+            try:
+                signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            except ValueError:
+                pass
+
+            print("Listening on %s" % self.socket_path, file=sys.stderr)
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.remove(self.socket_path)
+
+
+class Client(object):
+    """Sends conversion requests to a Server listening on `socket_path`"""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+
+    def convert(self, converter_args):
+        """Converts a project on the server. Takes PandocConverter's keyword
+        arguments (relative paths are relative to the current directory, as
+        they would be locally) and yields the encoded document in chunks.
+        Raises FatalError if the conversion fails."""
+        args = dict(converter_args)
+        args['config_file'] = os.path.abspath(args.get('config_file',
+                                                       'mkdocs.yml'))
+        args['base_dir'] = os.path.abspath(args.get('base_dir') or '.')
+        if args.get('cache_dir'):
+            args['cache_dir'] = os.path.abspath(args['cache_dir'])
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except socket.error as e:
+            sock.close()
+            raise FatalError("Couldn't connect to %s: %s" % (self.socket_path,
+                e), 1)
+
+        try:
+            send_frame(sock, REQUEST, json.dumps(args).encode('utf-8'))
+            f = sock.makefile('rb')
+
+            while True:
+                kind, payload = recv_frame(f)
+                if kind == DATA:
+                    yield payload
+                elif kind == DONE:
+                    return
+                elif kind == ERROR:
+                    error = json.loads(payload.decode('utf-8'))
+                    raise FatalError(error['message'], error['status'])
+                else:
+                    raise FatalError("%s closed the connection" %
+                            self.socket_path, 1)
+        finally:
+            sock.close()
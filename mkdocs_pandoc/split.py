@@ -0,0 +1,132 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Split output: one pandoc document per chapter plus a manifest, so
+chapters can be converted by pandoc in parallel and rebuilt individually"""
+
+import hashlib
+import io
+import json
+import os
+import re
+
+from mkdocs_pandoc.exceptions import FatalError
+from mkdocs_pandoc.output import chunks, write_chunks_atomic
+
+MANIFEST = 'manifest.json'
+
+# Bump this whenever the manifest changes form
+MANIFEST_VERSION = 1
+
+
+def chapter_filename(number, title, digits=2):
+    """Returns the file name for chapter `number`: the number, zero padded
+    to `digits` digits so file names sort in order, and the title"""
+    slug = re.sub(r'[^a-z0-9]+', '-', title.lower()).strip('-')
+    return '%0*d-%s.pd' % (digits, number, slug or 'chapter')
+
+
+def read_manifest(directory):
+    """Returns the manifest in `directory`, or None if there is none"""
+    try:
+        with io.open(os.path.join(directory, MANIFEST), 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def file_digest(path):
+    """Returns the SHA1 hex digest of the file `path`, or None if it cannot
+    be read"""
+    try:
+        with io.open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def write_chapters(converter, directory):
+    """Converts a project with PandocConverter.convert_chapters() and writes
+    every chapter to its own file in `directory`, along with a manifest
+    (manifest.json) listing the chapters in order with their pages, heading
+    levels and the SHA1 hash of their file's content. Files whose content
+    did not change are left alone, files of chapters that no longer exist
+    are removed. Returns the manifest."""
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            raise FatalError("Couldn't create %s: %s" % (directory,
+                e.strerror), 1)
+
+    old = read_manifest(directory)
+    digits = max(2, len(str(len(converter.pages.chapters))))
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'encoding': converter.encoding,
+        # Added to the level of every header in the pages
+        'headlevel_offset': converter.pages.max_level,
+        'chapters': [],
+    }
+
+    for title, pages, lines in converter.convert_chapters():
+        number = len(manifest['chapters']) + 1
+        filename = chapter_filename(number, title, digits)
+        path = os.path.join(directory, filename)
+
+        data = b''.join(chunks(lines, converter.encoding))
+        digest = hashlib.sha1(data).hexdigest()
+
+        if file_digest(path) != digest:
+            try:
+                write_chunks_atomic(path, [data])
+            except (IOError, OSError) as e:
+                raise FatalError("Couldn't write %s: %s" % (path,
+                    e.strerror), 1)
+
+        manifest['chapters'].append({
+            'number': number,
+            'file': filename,
+            'title': title,
+            'sha1': digest,
+            'lines': len(lines),
+            # Chapter headings of pages are headers of their page's level
+            'pages': [{'file': page['file'],
+                       'title': page['title'],
+                       'level': page['level']} for page in pages],
+        })
+
+    text = json.dumps(manifest, indent=2, sort_keys=True,
+                      separators=(',', ': ')) + '\n'
+    try:
+        write_chunks_atomic(os.path.join(directory, MANIFEST),
+                            [text.encode('utf-8')])
+    except (IOError, OSError) as e:
+        raise FatalError("Couldn't write %s: %s" % (
+            os.path.join(directory, MANIFEST), e.strerror), 1)
+
+    # Files are only removed if a previous manifest lists them, so files
+    # not written by mkdocs2pandoc are never touched.
+    current = set(chapter['file'] for chapter in manifest['chapters'])
+    for chapter in (old or {}).get('chapters', []):
+        stale = chapter.get('file')
+        if stale and stale not in current and \
+                os.path.basename(stale) == stale:
+            try:
+                os.remove(os.path.join(directory, stale))
+            except OSError:
+                pass
+
+    return manifest
@@ -0,0 +1,231 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Instrumentation for finding slow pages and filters"""
+
+import time
+
+# tracemalloc is only available on Python 3.4 and later
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def traced_memory():
+    """Returns the size of the memory blocks currently traced by tracemalloc
+    in bytes, or None if allocations are not traced"""
+    if tracemalloc is None or not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.get_traced_memory()[0]
+
+
+def start_tracing():
+    """Starts tracing allocations if tracemalloc is available"""
+    if tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def record(scope, name, page, seconds, lines_in, lines_out, alloc):
+    """Creates a statistics record. `scope` is 'page' for per-page filters or
+    'document' for filters applied to the whole document, `page` is the
+    page's file name (None for document filters) and `alloc` the change in
+    traced memory in bytes (None if allocations are not traced)."""
+    return {
+        'scope': scope,
+        'filter': name,
+        'page': page,
+        'seconds': seconds,
+        'lines_in': lines_in,
+        'lines_out': lines_out,
+        'alloc': alloc,
+    }
+
+
+def measure(scope, name, page, func, lines_in):
+    """Calls func() and returns its result (a list of lines, a PageBuffer or
+    None) along with a statistics record"""
+    mem = traced_memory()
+    start = timer()
+    lines = func()
+    seconds = timer() - start
+    alloc = None
+    if mem is not None:
+        alloc = traced_memory() - mem
+
+    lines_out = 0
+    if lines is not None:
+        lines_out = len(lines)
+
+    return lines, record(scope, name, page, seconds, lines_in, lines_out,
+                         alloc)
+
+
+def filter_name(f):
+    """Returns a short name for a filter. Filters fused by a RewriteFilter
+    are reported together, e.g. 'anchor+xref+toc'."""
+    if hasattr(f, 'filters'):
+        return '+'.join([filter_name(g) for g in f.filters]) or 'rewrite'
+
+    name = type(f).__name__
+    if name.endswith('Filter'):
+        name = name[:-len('Filter')]
+
+    return name.lower()
+
+
+class StreamMeter(object):
+    """Measures a stage of a streaming filter chain. Time and allocations
+    include all upstream stages, since those run while this stage waits
+    for input; Stats.measure_chain() subtracts them."""
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.alloc = None
+        self.lines = 0
+
+    def wrap(self, lines):
+        """Yields the lines of an iterator, measuring their production"""
+        it = iter(lines)
+        tracing = traced_memory() is not None
+        if tracing:
+            self.alloc = 0
+
+        while True:
+            mem = traced_memory() if tracing else None
+            start = timer()
+            try:
+                line = next(it)
+            except StopIteration:
+                self.add(start, mem)
+                return
+            self.add(start, mem)
+            self.lines += 1
+            yield line
+
+    def add(self, start, mem):
+        self.seconds += timer() - start
+        if mem is not None:
+            self.alloc += traced_memory() - mem
+
+
+class Stats(object):
+    """Collects statistics records during conversions. Every hook in `hooks`
+    is called with each record as it is added, e.g. for feeding them into
+    other metrics systems."""
+
+    def __init__(self, hooks=None, trace_memory=False):
+        self.hooks = list(hooks or [])
+        self.trace_memory = trace_memory
+        self.records = []
+
+        if trace_memory:
+            start_tracing()
+
+    def add(self, record):
+        """Adds a record and passes it to the hooks"""
+        self.records.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    def measure_chain(self, stages, names):
+        """Wraps a streaming filter chain for measurement. `stages` is a list
+        of functions, each taking an iterator of lines and returning the next
+        stage's iterator (the first one is called without arguments), and
+        `names` their names. Returns the final iterator; records for all
+        stages are added once it is exhausted."""
+        meters = []
+        stream = None
+
+        for stage, name in zip(stages, names):
+            stream = stage() if stream is None else stage(stream)
+            meter = StreamMeter(name)
+            meters.append(meter)
+            stream = meter.wrap(stream)
+
+        return self._finish_chain(stream, meters)
+
+    def _finish_chain(self, stream, meters):
+        for line in stream:
+            yield line
+
+        prev = None
+        for meter in meters:
+            seconds = meter.seconds
+            alloc = meter.alloc
+            lines_in = 0
+            if prev:
+                seconds -= prev.seconds
+                if alloc is not None and prev.alloc is not None:
+                    alloc -= prev.alloc
+                lines_in = prev.lines
+            self.add(record('document', meter.name, None, seconds, lines_in,
+                            meter.lines, alloc))
+            prev = meter
+
+    def filters(self):
+        """Returns totals per filter and scope, slowest first"""
+        totals = {}
+        for r in self.records:
+            key = (r['scope'], r['filter'])
+            if key not in totals:
+                totals[key] = record(r['scope'], r['filter'], None, 0.0, 0, 0,
+                                     None)
+            t = totals[key]
+            t['seconds'] += r['seconds']
+            t['lines_in'] += r['lines_in']
+            t['lines_out'] += r['lines_out']
+            if r['alloc'] is not None:
+                t['alloc'] = (t['alloc'] or 0) + r['alloc']
+
+        return sorted(totals.values(), key=lambda t: -t['seconds'])
+
+    def pages(self):
+        """Returns (seconds, page) tuples with the total per-page processing
+        time of every page, slowest first"""
+        totals = {}
+        for r in self.records:
+            if r['scope'] == 'page':
+                totals[r['page']] = totals.get(r['page'], 0.0) + r['seconds']
+
+        return sorted([(seconds, page) for page, seconds in totals.items()],
+                      reverse=True)
+
+    def as_dict(self):
+        """Returns all statistics as a dictionary suitable for JSON"""
+        return {
+            'filters': self.filters(),
+            'pages': [{'page': page, 'seconds': seconds}
+                      for seconds, page in self.pages()],
+            'records': self.records,
+        }
+
+    def report(self, top=10):
+        """Returns a human readable report of the `top` slowest pages and
+        all filters as a list of lines"""
+        lines = ['Slowest pages:']
+        for seconds, page in self.pages()[:top]:
+            lines.append('  %8.4f s  %s' % (seconds, page))
+
+        lines.append('Filters:')
+        for t in self.filters():
+            lines.append('  %8.4f s  %-8s %-20s %9d -> %9d lines' %
+                         (t['seconds'], t['scope'], t['filter'],
+                          t['lines_in'], t['lines_out']))
+
+        return lines
+
@@ -0,0 +1,267 @@
+# Copyright 2015 Johannes Grassler <johannes@btw23.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Watch mode: keeps a converted document up to date with its sources"""
+
+from __future__ import print_function
+
+import itertools
+import os
+import sys
+import time
+
+from mkdocs_pandoc.exceptions import FatalError
+from mkdocs_pandoc.output import write_atomic
+from mkdocs_pandoc.pandoc_converter import PandocConverter, PageProcessor
+import mkdocs_pandoc.filters.xref
+
+# inotify is used to wait for changes if available, otherwise the source
+# files are polled.
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class Watcher(object):
+    """Long-running converter that rewrites `outfile` whenever the pages, the
+    files they include or the configuration file change. Only the pages
+    affected by a change are processed again. Takes the same keyword
+    arguments as PandocConverter, plus `interval`, the number of seconds
+    between checks for changes."""
+
+    def __init__(self, outfile, **kwargs):
+        self.outfile = outfile
+        self.interval = kwargs.pop('interval', 1.0)
+        self.kwargs = kwargs
+        self.config_file = os.path.normpath(
+                kwargs.get('config_file', 'mkdocs.yml'))
+        self.encoding = kwargs.get('encoding', 'utf-8')
+
+        self.mtimes = {}
+        self.inotify = None
+        self.watched = set()
+
+        if inotify_simple:
+            self.inotify = inotify_simple.INotify()
+
+    def load(self):
+        """(Re)reads the configuration file and converts all pages"""
+        self.converter = PandocConverter(**self.kwargs)
+        self.pages = self.converter.pages
+        self.processor = PageProcessor(self.converter, self.pages)
+        self.filters = None
+
+        self.paths = [self.processor.path(page) for page in self.pages]
+        self.page_lines = [None] * len(self.pages) # per-page filter output
+        self.doc_lines = [None] * len(self.pages)  # ...after document filters
+        self.open_fence = [False] * len(self.pages)
+        self.headers = [None] * len(self.pages)
+        self.filter_headers = None # headers the document filters know
+
+        # Which pages include which files only needs tracking (and
+        # python-markdown only needs importing) if includes are resolved.
+        self.graph = None
+        if self.processor.filter_include:
+            from mkdocs_pandoc.filters.include import IncludeGraph
+            self.graph = IncludeGraph()
+
+        for i in range(len(self.pages)):
+            if self.graph is not None:
+                self.processor.add_to_graph(self.graph, self.pages[i])
+            self.process_page(i)
+
+        self.filter_pages(range(len(self.pages)))
+        self.write()
+
+    def process_page(self, i):
+        """Runs page `i` through the per-page filters"""
+        lines = self.processor.process(self.pages[i]) + ['']
+
+        self.page_lines[i] = lines
+        if self.converter.filter_xrefs:
+            self.headers[i] = mkdocs_pandoc.filters.xref.page_headers(lines)
+
+    def filter_pages(self, indices):
+        """Runs the pages at `indices` through the document filters. If any
+        page's headers changed, cross-references in all pages may resolve
+        differently, so the filters are recreated and all pages filtered
+        again."""
+        if self.filters is None or self.headers != self.filter_headers:
+            self.filter_headers = list(self.headers)
+            self.filters = self.converter.document_filters(self.pages,
+                    self.filter_headers if self.converter.filter_xrefs
+                    else None)
+            indices = range(len(self.pages))
+
+        for i in indices:
+            self.doc_lines[i] = list(self.converter.filter_document(
+                iter(self.page_lines[i]), self.filters))
+            self.open_fence[i] = True in [getattr(f, 'in_fence', False)
+                                          for f in self.filters]
+
+    def write(self):
+        """Writes the document to the output file"""
+        # Document filters can be applied to pages individually unless a code
+        # block continues from one page into the next.
+        if True in self.open_fence[:-1]:
+            lines = self.converter.filter_document(
+                    itertools.chain(*self.page_lines), self.filters)
+        else:
+            lines = itertools.chain(*self.doc_lines)
+
+        try:
+            write_atomic(self.outfile, lines, self.encoding)
+        except (IOError, OSError) as e:
+            raise FatalError("Couldn't write %s: %s" % (self.outfile,
+                e.strerror), 1)
+
+    def sources(self):
+        """Returns the set of files to watch: the configuration file, all
+        files below docs_dir and all included files."""
+        sources = set([self.config_file])
+
+        for dirpath, dirnames, filenames in os.walk(
+                self.converter.config['docs_dir']):
+            for filename in filenames:
+                sources.add(os.path.normpath(os.path.join(dirpath, filename)))
+
+        if self.graph is not None:
+            sources.update(self.graph.edges.keys())
+
+        return sources
+
+    def scan(self):
+        """Returns the set of watched files that were modified, created or
+        deleted since the last scan."""
+        mtimes = {}
+
+        for path in self.sources():
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                continue
+
+        changed = set()
+        for path in set(mtimes.keys()) | set(self.mtimes.keys()):
+            if mtimes.get(path) != self.mtimes.get(path):
+                changed.add(path)
+
+        self.mtimes = mtimes
+
+        return changed
+
+    def update(self, changed):
+        """Processes the pages affected by changes to the files in `changed`
+        and rewrites the output file. Returns the number of pages
+        processed."""
+        if self.config_file in changed:
+            self.load()
+            return len(self.pages)
+
+        affected = set(changed)
+        if self.graph is not None:
+            self.update_graph(changed, affected)
+
+        processed = []
+        for i in range(len(self.pages)):
+            if self.paths[i] in affected:
+                self.process_page(i)
+                processed.append(i)
+
+        if processed:
+            self.filter_pages(processed)
+            self.write()
+
+        return len(processed)
+
+    def update_graph(self, changed, affected):
+        """Adds the pages depending on a file in `changed` to `affected`,
+        then updates the include graph"""
+        # Pages depending on a changed file are found through the include
+        # graph as it was before the change...
+        for path in changed:
+            affected.update(self.graph.dependents(path))
+
+        # ...then the graph is updated.
+        f_include = self.processor.f_include
+        for i in range(len(self.pages)):
+            if self.paths[i] in changed:
+                try:
+                    self.processor.add_to_graph(self.graph, self.pages[i])
+                except FatalError:
+                    self.graph.add(self.paths[i], [])
+
+        for path in changed:
+            if path not in self.paths and path in self.graph.edges:
+                try:
+                    text = f_include.cache.get(path, f_include.encoding)
+                except (IOError, OSError):
+                    text = []
+                f_include.add_to_graph(self.graph, path, text)
+
+    def wait(self):
+        """Waits for files to change. Returns False if it is certain that
+        nothing changed."""
+        if not self.inotify:
+            time.sleep(self.interval)
+            return True
+
+        # inotify watches are not recursive, so every directory containing a
+        # watched file needs its own watch.
+        flags = inotify_simple.flags
+        mask = (flags.MODIFY | flags.CLOSE_WRITE | flags.CREATE |
+                flags.DELETE | flags.MOVED_TO | flags.MOVED_FROM)
+
+        for dirname in set([os.path.dirname(path) or '.'
+                            for path in self.sources()]):
+            if dirname not in self.watched:
+                try:
+                    self.inotify.add_watch(dirname, mask)
+                except OSError:
+                    continue
+                self.watched.add(dirname)
+
+        # Wait for events, then collect the remaining ones an editor's save
+        # produces.
+        return len(self.inotify.read(timeout=int(self.interval * 1000),
+                                     read_delay=50)) > 0
+
+    def run(self):
+        """Converts the document, then keeps it up to date until
+        interrupted."""
+        self.load()
+        self.scan()
+        print("Wrote %s, watching for changes" % self.outfile,
+                file=sys.stderr)
+
+        while True:
+            if not self.wait():
+                continue
+
+            changed = self.scan()
+            if not changed:
+                continue
+
+            start = time.time()
+            try:
+                count = self.update(changed)
+            except FatalError as e:
+                print(e.message, file=sys.stderr)
+                continue
+
+            if count:
+                print("Wrote %s (%d pages updated in %.2f s)" %
+                        (self.outfile, count, time.time() - start),
+                        file=sys.stderr)